@@ -0,0 +1,267 @@
+"""
+Vistas asíncronas (ASGI) para el carrito y el catálogo de solo lectura.
+
+Usan redis.asyncio y el ORM asíncrono de Django, así que mientras esperan a
+Redis o a PostgreSQL no bloquean el worker. Las respuestas tienen el mismo
+formato que las vistas síncronas equivalentes. Bajo WSGI también responden
+(cada una en su propio event loop), pero solo aprovechan la concurrencia
+bajo un servidor ASGI (ver SERVER_MODE=asgi en entrypoint.sh).
+"""
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Product
+from api.utils import cart_batch, cart_store, http_cache, stock_reservations, user_cache
+from api.utils.cart_hydration import ahydrate_cart, aload_cart_products, build_cart_items
+from api.utils.catalog_cache import aget_cached_response
+from api.views import ProductListAPIView, TopDiscountedGearAPIView, TopSellingBicyclesAPIView
+
+
+async def _authenticate(request):
+    """Valida el JWT del header Authorization y carga el usuario (cacheado) de forma asíncrona"""
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) != 2 or parts[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        token = AccessToken(parts[1])
+    except TokenError:
+        return None
+    try:
+        user = await user_cache.aget_user(token[jwt_settings.USER_ID_CLAIM])
+    except (User.DoesNotExist, KeyError):
+        return None
+    return user if user.is_active else None
+
+
+def async_api_view(methods, authenticated=True):
+    """Equivalente asíncrono de @api_view + @permission_classes([IsAuthenticated])"""
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if authenticated:
+                request.user = await _authenticate(request)
+                if request.user is None:
+                    return JsonResponse(
+                        {"detail": "Las credenciales de autenticación no se proveyeron o son inválidas."},
+                        status=401
+                    )
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _request_data(request):
+    """Cuerpo de la petición (JSON o formulario), o None si no es un objeto"""
+    if not request.body:
+        return {}
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return request.POST
+    return data if isinstance(data, dict) else None
+
+
+def _line(request):
+    """
+    (product_id, quantity) del cuerpo de cart/add/ y cart/update/, o una
+    respuesta 400 si el cuerpo no es un objeto o los valores no son enteros
+    """
+    data = _request_data(request)
+    if data is None:
+        return None, JsonResponse({"error": "El cuerpo debe ser un objeto JSON"}, status=400)
+    product_id = data.get("product_id")
+    try:
+        quantity = int(data.get("quantity", 1))
+        product_id = int(product_id) if product_id not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, JsonResponse({"error": "product_id y quantity deben ser enteros"}, status=400)
+    return (product_id, quantity), None
+
+
+# ---------------------------------------------------------------------------
+# Carrito
+# ---------------------------------------------------------------------------
+
+def _cart_response(enriched_cart, total_amount):
+    return JsonResponse({
+        "items": enriched_cart,
+        "total_items": len(enriched_cart),
+        "total_amount": str(total_amount)
+    })
+
+
+async def _reserve_line(user_id, product_id, quantity):
+    stock = await Product.objects.filter(id=product_id).values_list('stock', flat=True).afirst()
+    if stock is None:
+        return JsonResponse({"error": "Producto no encontrado"}, status=404)
+
+    try:
+        await stock_reservations.areserve(user_id, {product_id: quantity}, {product_id: stock})
+    except stock_reservations.StockUnavailable as e:
+        return JsonResponse({"error": e.message, "available": e.available}, status=409)
+    return None
+
+
+def _cart_validators(response, etag):
+    return http_cache.set_validators(response, etag, cache_control='private, no-cache', vary=('Authorization',))
+
+
+@async_api_view(['GET'])
+async def view_cart(request):
+    etag = await cart_store.acart_etag(request.user.id)
+    not_modified = http_cache.not_modified(request, etag)
+    if not_modified is not None:
+        return _cart_validators(not_modified, etag)
+
+    cart_data = await cart_store.aget_cart(request.user.id)
+    if not cart_data:
+        return _cart_validators(_cart_response([], "0.00"), etag)
+    return _cart_validators(_cart_response(*await ahydrate_cart(cart_data)), etag)
+
+
+@async_api_view(['GET'])
+async def view_cart_detailed(request):
+    cart_data = await cart_store.aget_cart(request.user.id)
+    if not cart_data:
+        return _cart_response([], "0.00")
+    return _cart_response(*await ahydrate_cart(cart_data, detailed=True))
+
+
+@async_api_view(['POST'])
+async def add_to_cart(request):
+    line, error = _line(request)
+    if error:
+        return error
+    product_id, quantity = line
+
+    if quantity <= 0:
+        return JsonResponse({"error": "La cantidad debe ser mayor a 0"}, status=400)
+
+    error = await _reserve_line(request.user.id, product_id, quantity)
+    if error:
+        return error
+
+    await cart_store.aset_quantity(request.user.id, product_id, quantity)
+    return JsonResponse({"message": "Producto agregado al carrito"})
+
+
+@async_api_view(['POST'])
+async def remove_from_cart(request):
+    user_id = request.user.id
+    product_id = (_request_data(request) or {}).get('product_id')
+
+    if not product_id:
+        return JsonResponse({"error": "product_id es requerido"}, status=400)
+
+    if await cart_store.aremove_item(user_id, product_id):
+        await stock_reservations.arelease(user_id, [product_id])
+        return JsonResponse({"message": "Producto removido del carrito"})
+    elif await cart_store.acart_exists(user_id):
+        return JsonResponse({"error": "Producto no encontrado en el carrito"}, status=404)
+    else:
+        return JsonResponse({"error": "Carrito vacío"}, status=404)
+
+
+@async_api_view(['POST'])
+async def update_cart_quantity(request):
+    line, error = _line(request)
+    if error:
+        return error
+    product_id, quantity = line
+
+    if not product_id:
+        return JsonResponse({"error": "product_id es requerido"}, status=400)
+
+    if quantity <= 0:
+        return JsonResponse({"error": "La cantidad debe ser mayor a 0"}, status=400)
+
+    error = await _reserve_line(request.user.id, product_id, quantity)
+    if error:
+        return error
+
+    await cart_store.aset_quantity(request.user.id, product_id, quantity)
+    return JsonResponse({"message": "Cantidad actualizada en el carrito"})
+
+
+@async_api_view(['POST'])
+async def batch_update_cart(request):
+    user_id = request.user.id
+    try:
+        lines = cart_batch.parse_operations(_request_data(request))
+    except cart_batch.InvalidBatch as e:
+        return JsonResponse(e.as_dict(), status=400)
+
+    products = {
+        product.pk: product
+        async for product in Product.objects.with_details().filter(pk__in=list(lines))
+    }
+    missing = cart_batch.missing_product(lines, products)
+    if missing is not None:
+        return JsonResponse({"error": "Producto no encontrado", "product_id": missing}, status=404)
+
+    reserve_lines, stocks, gone = cart_batch.reservation(lines, products)
+    try:
+        await stock_reservations.areserve(user_id, reserve_lines, stocks)
+    except stock_reservations.StockUnavailable as e:
+        return JsonResponse(
+            {"error": e.message, "product_id": e.product_id, "available": e.available},
+            status=409
+        )
+    await stock_reservations.arelease(user_id, gone)
+
+    cart_data = await cart_store.aapply_batch(user_id, lines)
+    products.update(await aload_cart_products(cart_batch.other_lines(cart_data, products)))
+    return _cart_response(*build_cart_items(cart_data, products))
+
+
+@async_api_view(['POST'])
+async def clear_cart(request):
+    cart_data = await cart_store.aget_cart(request.user.id)
+    await stock_reservations.arelease(request.user.id, cart_data.keys())
+    await cart_store.aclear_cart(request.user.id)
+    return JsonResponse({"message": "Carrito vaciado completamente"})
+
+
+# ---------------------------------------------------------------------------
+# Catálogo (solo lectura)
+# ---------------------------------------------------------------------------
+
+def _catalog_view(view_class):
+    """
+    Sirve la respuesta cacheada del catálogo directamente desde redis.asyncio.
+    Si no hay entrada, delega en la vista síncrona (que la genera y la guarda)
+    ejecutándola en un hilo para no bloquear el event loop.
+    """
+    sync_view = sync_to_async(view_class.as_view())
+
+    @async_api_view(['GET'], authenticated=False)
+    async def view(request):
+        wants_json = (
+            'text/html' not in request.headers.get('Accept', '')
+            and request.GET.get('format') in (None, 'json')
+        )
+        if wants_json:
+            response = await aget_cached_response(
+                request, view_class.cache_name, view_class.cache_depends_on_stock
+            )
+            if response is not None:
+                return response
+        return await sync_view(request)
+
+    return view
+
+
+product_list = _catalog_view(ProductListAPIView)
+gear_discounts = _catalog_view(TopDiscountedGearAPIView)
+top_bicycles = _catalog_view(TopSellingBicyclesAPIView)
@@ -0,0 +1,39 @@
+"""
+Autenticación JWT con usuarios cacheados
+"""
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from api.utils import user_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Igual que JWTAuthentication, pero el usuario del token se lee de
+    api.utils.user_cache en lugar de consultar PostgreSQL en cada request.
+    La firma y el vencimiento del token se validan como siempre.
+    """
+
+    def get_user(self, validated_token):
+        # La verificación de revocación compara el hash de la contraseña,
+        # que no se cachea: en ese modo se usa la consulta original
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = user_cache.get_user(user_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,146 @@
+"""
+Comando para medir el costo del logging de depuración en el checkout.
+
+Ejecuta process_checkout con un carrito de varias líneas en tres modos:
+
+- compilado fuera: CHECKOUT_DEBUG_LOGGING=False (producción), el bucle no
+  evalúa nada;
+- desactivado por nivel: CHECKOUT_DEBUG_LOGGING=True con el logger ``api``
+  en INFO, solo paga logger.debug() y el chequeo de nivel por item;
+- emitido: CHECKOUT_DEBUG_LOGGING=True con ``api`` en DEBUG, cada mensaje
+  pasa por los filtros y el formatter (escribiendo a /dev/null).
+
+Además del checkout completo (dominado por PostgreSQL) se mide aparte la
+sentencia de log del bucle de validación, que es lo que cambia entre modos.
+
+Los modos se alternan en cada repetición y se toma la mejor. Cada medición
+crea sus productos, su usuario y sus compras dentro de una transacción que
+se revierte al final, así que puede correr contra cualquier base de datos.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Bicycle, Category, Product, UserProfile
+from api.utils import checkout
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia del checkout con el logging DEBUG compilado fuera, desactivado y emitido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=20, help='Líneas por checkout')
+        parser.add_argument('--checkouts', type=int, default=50, help='Checkouts por medición')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones (se toma la mejor)')
+
+    def _seed(self, count):
+        category = Category.objects.create(name='benchmark-checkout')
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"bench-checkout-{index}",
+                price='10.00',
+                category=category,
+                stock=1_000_000,
+                type='bicycle' if index % 2 == 0 else 'accessory',
+                discount=index % 30,
+            )
+            for index in range(count)
+        )
+        Bicycle.objects.bulk_create(
+            Bicycle(
+                product=product, bike_type='montaña', wheel_size=29,
+                color='negro', material='aluminio', weight='12.40',
+            )
+            for product in products if product.type == 'bicycle'
+        )
+        user = User.objects.create_user(username='benchmark-checkout')
+        UserProfile.objects.create(user=user, credit=Decimal('99999999.99'))
+        return user, [{'product_id': product.pk, 'quantity': 1} for product in products]
+
+    @contextmanager
+    def _mode(self, debug_logging, level, null_stream):
+        api_logger = logging.getLogger('api')
+        previous = checkout.DEBUG_LOGGING, api_logger.level
+        streams = [
+            (handler, handler.setStream(null_stream))
+            for handler in api_logger.handlers if isinstance(handler, logging.StreamHandler)
+        ]
+        checkout.DEBUG_LOGGING = debug_logging
+        api_logger.setLevel(level)
+        try:
+            yield
+        finally:
+            checkout.DEBUG_LOGGING, level = previous
+            api_logger.setLevel(level)
+            for handler, stream in streams:
+                handler.setStream(stream)
+
+    def _run(self, items, checkouts, null_stream, debug_logging, level):
+        """Segundos por checkout en un modo, con datos nuevos que se revierten al final"""
+        # Cada medición parte de filas recién creadas: repetir UPDATEs sobre
+        # las mismas filas en una transacción larga encarece los siguientes
+        try:
+            with transaction.atomic():
+                user, lines = self._seed(items)
+                checkout.process_checkout(user, lines)  # calentar caches y conexiones
+                with self._mode(debug_logging, level, null_stream):
+                    start = time.perf_counter()
+                    for _ in range(checkouts):
+                        checkout.process_checkout(user, lines)
+                    elapsed = (time.perf_counter() - start) / checkouts
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return elapsed
+
+    def _per_message(self, null_stream, debug_logging, level, count=10000):
+        """Microsegundos de la sentencia de log por item de _validate_lines"""
+        with self._mode(debug_logging, level, null_stream):
+            start = time.perf_counter()
+            for index in range(count):
+                if checkout.DEBUG_LOGGING:
+                    checkout.logger.debug(
+                        "Item validado - producto=%s tipo=%s cantidad=%s stock=%s",
+                        index, 'bicycle', 1, 100
+                    )
+            return (time.perf_counter() - start) / count
+
+    def handle(self, *args, **options):
+        items, checkouts, repeat = options['items'], options['checkouts'], options['repeat']
+        if items <= 0 or checkouts <= 0 or repeat <= 0:
+            raise CommandError('--items, --checkouts y --repeat deben ser mayores a 0')
+
+        modes = (
+            ('compilado fuera (producción)', False, logging.INFO),
+            ('desactivado por nivel (INFO)', True, logging.INFO),
+            ('emitido (DEBUG)', True, logging.DEBUG),
+        )
+        best = {name: None for name, _, _ in modes}
+        per_message = {name: None for name, _, _ in modes}
+
+        with open(os.devnull, 'w') as null_stream:
+            for _ in range(repeat):
+                for name, debug_logging, level in modes:
+                    elapsed = self._run(items, checkouts, null_stream, debug_logging, level)
+                    best[name] = elapsed if best[name] is None else min(best[name], elapsed)
+                    elapsed = self._per_message(null_stream, debug_logging, level)
+                    per_message[name] = elapsed if per_message[name] is None else min(per_message[name], elapsed)
+
+        baseline = best[modes[0][0]]
+        self.stdout.write(f"Checkouts de {items} líneas: {checkouts} por medición (mejor de {repeat})")
+        self.stdout.write(f"{'':<32}{'ms/checkout':>12}{'vs producción':>16}{'µs/item (log)':>16}")
+        for name, _, _ in modes:
+            self.stdout.write(
+                f"{name:<32}{best[name] * 1000:>12.3f}{(best[name] - baseline) * 1000:>+13.3f} ms"
+                f"{per_message[name] * 1e6:>16.3f}"
+            )
@@ -0,0 +1,107 @@
+"""
+Comando para comparar el camino de serialización del catálogo.
+
+Mide, por cada 1000 productos, cuánto tarda serializar y renderizar el
+listado con el camino de siempre (instancias + ProductWithDetailsSerializer +
+JSONRenderer) y con el rápido (values() + ProductRowSerializer +
+FastJSONRenderer), y verifica que ambos produzcan exactamente los mismos
+bytes. La carga desde la base de datos se reporta aparte.
+
+Los productos se crean dentro de una transacción que se revierte al final,
+así que puede correr contra cualquier base de datos.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Bicycle, Category, Product
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import PRODUCT_ROW_VALUES, ProductRowSerializer, ProductWithDetailsSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de serializar+renderizar productos con ModelSerializer y con el camino rápido'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Productos a serializar')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones (se toma la mejor)')
+
+    def _seed(self, count):
+        category = Category.objects.create(name='benchmark-serializers')
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"bench-{index}",
+                price='1234.50',
+                description='Producto de prueba para el benchmark de serialización',
+                image_url=f"https://example.com/bench/{index}.jpg",
+                category=category,
+                stock=index % 40,
+                type='bicycle' if index % 2 == 0 else 'accessory',
+                discount=index % 50,
+            )
+            for index in range(count)
+        )
+        Bicycle.objects.bulk_create(
+            Bicycle(
+                product=product, bike_type='montaña', wheel_size=29,
+                color='negro', material='aluminio', weight='12.40',
+            )
+            for product in products if product.type == 'bicycle'
+        )
+        return category
+
+    def _best(self, repeat, operation):
+        best = None
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = operation()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        count, repeat = options['products'], options['repeat']
+        if count <= 0 or repeat <= 0:
+            raise CommandError('--products y --repeat deben ser mayores a 0')
+
+        try:
+            with transaction.atomic():
+                category = self._seed(count)
+                queryset = Product.objects.with_details().filter(category=category).order_by('id')
+
+                load_models, products = self._best(repeat, lambda: list(queryset.all()))
+                load_rows, rows = self._best(repeat, lambda: list(queryset.values(*PRODUCT_ROW_VALUES)))
+
+                model_time, model_body = self._best(repeat, lambda: JSONRenderer().render(
+                    ProductWithDetailsSerializer(products, many=True).data
+                ))
+                fast_time, fast_body = self._best(repeat, lambda: FastJSONRenderer().render(
+                    ProductRowSerializer(rows).data
+                ))
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        per_thousand = 1000 / count
+        self.stdout.write(f"Productos: {count} (mejor de {repeat}), orjson: {'sí' if orjson else 'no'}")
+        self.stdout.write(f"{'':<36}{'carga SQL':>12}{'serializar+render':>20}")
+        self.stdout.write(
+            f"{'ModelSerializer + JSONRenderer':<36}"
+            f"{load_models * per_thousand * 1000:>9.1f} ms{model_time * per_thousand * 1000:>17.1f} ms"
+        )
+        self.stdout.write(
+            f"{'values() + ProductRowSerializer':<36}"
+            f"{load_rows * per_thousand * 1000:>9.1f} ms{fast_time * per_thousand * 1000:>17.1f} ms"
+        )
+        self.stdout.write(f"Tiempos por cada 1000 productos; aceleración al serializar: {model_time / fast_time:.1f}x")
+
+        if model_body != fast_body:
+            raise CommandError('Las salidas difieren: el camino rápido no es compatible byte a byte')
+        self.stdout.write(self.style.SUCCESS('Salidas idénticas byte a byte'))
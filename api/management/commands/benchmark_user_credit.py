@@ -0,0 +1,131 @@
+"""
+Comando para medir /api/user/credit/ con y sin el cache de usuarios.
+
+Compara, en consultas SQL y milisegundos por request:
+
+- sin cache: JWTAuthentication de simplejwt + UserProfile.objects.get_or_create
+  (como era la vista antes de CachedJWTAuthentication);
+- cache frío: CachedJWTAuthentication con el usuario y el perfil fuera de
+  Redis y del cache local (primer request de un usuario);
+- cache en Redis: el cache local del worker vencido;
+- cache local: usuario en memoria del worker y perfil en Redis.
+
+Los requests pasan por la autenticación, los permisos y el renderer de DRF
+(sin los middlewares). El usuario se crea dentro de una transacción que se
+revierte al final, así que puede correr contra cualquier base de datos.
+"""
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import UserProfile
+from api.utils import user_cache
+from api.views import UserCreditView
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _UncachedUserCreditView(APIView):
+    """UserCreditView sin el cache de usuarios, para comparar"""
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user_profile, created = UserProfile.objects.get_or_create(
+            user=request.user,
+            defaults={'credit': Decimal('1000.00')}
+        )
+        return Response({
+            "username": request.user.username,
+            "credit": str(user_profile.credit),
+            "is_new_profile": created
+        }, status=status.HTTP_200_OK)
+
+
+class Command(BaseCommand):
+    help = 'Compara consultas y latencia de /api/user/credit/ con y sin el cache de usuarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests por medición')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones (se toma la mejor)')
+
+    def _measure(self, view, request_factory, before_each, count, repeat):
+        """(ms por request, consultas por request) tomando la mejor repetición"""
+        best = None
+        for _ in range(repeat):
+            elapsed = 0.0
+            for _ in range(count):
+                before_each()
+                request = request_factory()
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                elapsed += time.perf_counter() - start
+                if response.status_code != 200:
+                    raise CommandError(f"/api/user/credit/ respondió {response.status_code}")
+            best = elapsed if best is None else min(best, elapsed)
+
+        before_each()
+        with CaptureQueriesContext(connection) as queries:
+            view(request_factory()).render()
+        return best / count * 1000, len(queries)
+
+    def handle(self, *args, **options):
+        count, repeat = options['requests'], options['repeat']
+        if count <= 0 or repeat <= 0:
+            raise CommandError('--requests y --repeat deben ser mayores a 0')
+
+        factory = APIRequestFactory()
+        results = []
+        user = None
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='benchmark-user-credit')
+                UserProfile.objects.create(user=user, credit=Decimal('1000.00'))
+                authorization = f"Bearer {AccessToken.for_user(user)}"
+
+                def request_factory():
+                    return factory.get('/api/user/credit/', HTTP_AUTHORIZATION=authorization)
+
+                def cold():
+                    user_cache.invalidate_user(user.pk)
+                    user_cache.invalidate_profile(user.pk)
+
+                def local_expired():
+                    user_cache._local.pop(user.pk, None)
+
+                modes = (
+                    ('sin cache (JWTAuthentication)', _UncachedUserCreditView.as_view(), lambda: None),
+                    ('cache frío', UserCreditView.as_view(), cold),
+                    ('cache en Redis', UserCreditView.as_view(), local_expired),
+                    ('cache local', UserCreditView.as_view(), lambda: None),
+                )
+                for name, view, before_each in modes:
+                    results.append((name, *self._measure(view, request_factory, before_each, count, repeat)))
+                raise _Rollback()
+        except _Rollback:
+            pass
+        finally:
+            # Lo cacheado apunta a filas revertidas
+            if user is not None:
+                user_cache.invalidate_user(user.pk)
+                user_cache.invalidate_profile(user.pk)
+
+        baseline = results[0][1]
+        self.stdout.write(f"{count} requests por medición (mejor de {repeat})")
+        self.stdout.write(f"{'':<32}{'consultas':>10}{'ms/request':>12}{'aceleración':>13}")
+        for name, elapsed, queries in results:
+            self.stdout.write(f"{name:<32}{queries:>10}{elapsed:>12.3f}{baseline / elapsed:>12.1f}x")
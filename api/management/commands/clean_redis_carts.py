@@ -1,43 +1,152 @@
 """
-Comando para limpiar carritos corruptos en Redis
+Comando para limpiar carritos corruptos en Redis y migrar los carritos
+antiguos (JSON en un string) al formato hash. A los carritos sin expiración
+(anteriores a CART_TTL) les agrega el TTL y la entrada en carts:activity,
+para que expiren y sweep_abandoned_carts los vea.
+
+Pensado para correr contra el Redis de producción: recorre las claves con
+SCAN (nunca KEYS, que bloquea el servidor mientras recorre todo el espacio
+de claves), consulta TYPE y GET por lotes en un pipeline, borra con UNLINK
+(la memoria se libera en segundo plano) y limita las claves por segundo.
 """
+import time
+
 from django.core.management.base import BaseCommand
+
+from api.utils.cart_store import backfill_expiry, cart_key, legacy_to_mapping, migrate_legacy_cart
 from api.utils.redis_client import redis_client
 
+# Cada cuántos lotes se informa el progreso
+PROGRESS_EVERY = 50
+
 
 class Command(BaseCommand):
-    help = 'Limpia todos los carritos corruptos en Redis'
+    help = 'Migra los carritos JSON al formato hash y limpia los carritos corruptos en Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=1000,
+            help='COUNT de SCAN y tamaño de los lotes del pipeline (default: 1000)',
+        )
+        parser.add_argument(
+            '--max-keys-per-second',
+            type=int,
+            default=5000,
+            help='Límite de claves revisadas por segundo; 0 = sin límite (default: 5000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar qué se migraría o eliminaría, sin modificar Redis',
+        )
 
     def handle(self, *args, **options):
-        # Buscar todas las claves de carrito
-        cart_keys = redis_client.keys('cart:*')
-        
-        corrupted_keys = []
-        fixed_keys = []
-        
-        for key in cart_keys:
-            try:
-                # Intentar obtener como string
-                value = redis_client.get(key)
-                if value:
-                    # Si es un string válido, no hacer nada
-                    import json
-                    json.loads(value)
-                    self.stdout.write(f"Carrito {key} está correcto")
-                else:
-                    # Si no es string, es hash - eliminar
-                    redis_client.delete(key)
-                    corrupted_keys.append(key)
-                    self.stdout.write(f"Eliminado carrito corrupto: {key}")
-            except Exception as e:
-                # Si hay error, eliminar la clave
-                redis_client.delete(key)
-                corrupted_keys.append(key)
-                self.stdout.write(f"Eliminado carrito corrupto: {key} - Error: {str(e)}")
-        
+        self.dry_run = options['dry_run']
+        self.verbose = options['verbosity'] >= 2
+        count = options['count']
+        rate = options['max_keys_per_second']
+
+        self.scanned = 0
+        self.migrated = 0
+        self.deleted = 0
+        self.backfilled = 0
+
+        start = time.monotonic()
+        batches = 0
+        batch = []
+        for key in redis_client.scan_iter(match='cart:*', count=count):
+            batch.append(key)
+            if len(batch) >= count:
+                self._process(batch)
+                batch = []
+                batches += 1
+                if batches % PROGRESS_EVERY == 0:
+                    self.stdout.write(
+                        f'  Revisadas: {self.scanned}, migradas: {self.migrated}, eliminadas: {self.deleted}'
+                    )
+                self._throttle(start, rate)
+        if batch:
+            self._process(batch)
+
+        prefix = '[dry-run] ' if self.dry_run else ''
         self.stdout.write(
             self.style.SUCCESS(
-                f'Proceso completado. '
-                f'Carritos corruptos eliminados: {len(corrupted_keys)}'
+                f'{prefix}Proceso completado en {time.monotonic() - start:.1f}s. '
+                f'Carritos revisados: {self.scanned}, '
+                f'Carritos migrados: {self.migrated}, '
+                f'Carritos con TTL agregado: {self.backfilled}, '
+                f'Carritos corruptos eliminados: {self.deleted}'
             )
         )
+
+    def _throttle(self, start, rate):
+        if rate <= 0:
+            return
+        # Dormir lo necesario para no superar `rate` claves por segundo en promedio
+        ahead = self.scanned / rate - (time.monotonic() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def _process(self, keys):
+        self.scanned += len(keys)
+
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+            pipe.ttl(key)
+        replies = pipe.execute()
+        types, ttls = replies[::2], replies[1::2]
+
+        legacy = [key for key, key_type in zip(keys, types) if key_type == 'string']
+        # Sin expiración (TTL -1): los migrados se suman abajo
+        no_expiry = [
+            key for key, key_type, ttl in zip(keys, types, ttls)
+            if key_type == 'hash' and ttl == -1
+        ]
+        # Hashes: formato actual. 'none': la clave expiró o se borró durante el recorrido
+        invalid = [
+            (key, f'tipo {key_type}') for key, key_type in zip(keys, types)
+            if key_type not in ('hash', 'string', 'none')
+        ]
+
+        if legacy:
+            pipe = redis_client.pipeline(transaction=False)
+            for key in legacy:
+                pipe.get(key)
+            for key, raw in zip(legacy, pipe.execute()):
+                if raw is None:
+                    continue
+                try:
+                    valid = bool(legacy_to_mapping(raw))
+                except (ValueError, TypeError, KeyError, AttributeError):
+                    valid = False
+                if not valid:
+                    invalid.append((key, 'JSON inválido'))
+                    continue
+                # La migración es atómica (WATCH) por si un request la hace a la vez
+                if self.dry_run or migrate_legacy_cart(key):
+                    self.migrated += 1
+                    no_expiry.append(key)
+                    self._log(f'Migrado carrito JSON a hash: {key}')
+
+        user_ids = [key.split(':', 1)[1] for key in no_expiry if key.split(':', 1)[1].isdigit()]
+        if user_ids:
+            if not self.dry_run:
+                backfill_expiry(user_ids)
+            self.backfilled += len(user_ids)
+            for user_id in user_ids:
+                self._log(f'TTL agregado: {cart_key(user_id)}')
+
+        if invalid:
+            if not self.dry_run:
+                redis_client.unlink(*(key for key, _ in invalid))
+            self.deleted += len(invalid)
+            for key, reason in invalid:
+                self._log(f'Eliminado carrito corrupto: {key} ({reason})')
+
+    def _log(self, message):
+        if self.verbose:
+            prefix = '[dry-run] ' if self.dry_run else ''
+            self.stdout.write(prefix + message)
@@ -0,0 +1,126 @@
+"""
+Comando para verificar con EXPLAIN que las consultas calientes usan índices.
+
+Arma las mismas consultas que ejecutan los endpoints (listado filtrado por
+tipo, categoría y precio, accesorios en oferta, ranking de ventas e
+hidratación del carrito) y revisa en el plan de cada una que se use el
+índice pensado para esa consulta. Funciona con PostgreSQL y con SQLite.
+
+El planner elige según los datos: con tablas pequeñas o filtros poco
+selectivos prefiere un Seq Scan, o recorrer la clave primaria en orden y
+filtrar (el listado ordena por id). Para medir sobre datos reales conviene
+poblar la base con ``generate_catalog``; --force-index (SET LOCAL
+enable_seqscan = off) comprueba al menos que el índice es utilizable.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.models import Category, Product
+from api.utils import leaderboard
+from api.views import ProductListAPIView, TopDiscountedGearAPIView
+
+
+class Command(BaseCommand):
+    help = 'Muestra el plan (EXPLAIN) de las consultas calientes y detecta recorridos completos de tabla'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Falla (exit code 1) si alguna consulta no usa su índice esperado',
+        )
+        parser.add_argument(
+            '--force-index',
+            action='store_true',
+            help='PostgreSQL: desactiva el Seq Scan para verificar que existe un índice utilizable',
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Imprime el plan completo de cada consulta',
+        )
+
+    def _view_queryset(self, view_class, query_string=''):
+        """get_queryset() de la vista con los parámetros indicados, paginado como el endpoint"""
+        view = view_class()
+        view.request = Request(RequestFactory().get(f'/?{query_string}'))
+        view.format_kwarg = None
+        return view.get_queryset()
+
+    def _queries(self):
+        page = settings.PRODUCTS_PAGE_SIZE + 1
+        category_id = Category.objects.values_list('pk', flat=True).first() or 1
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:10]) or [1]
+
+        # (nombre, tabla principal, índice esperado, queryset)
+        return [
+            ('products ?type=', 'api_product', 'product_type_id_idx',
+             self._view_queryset(ProductListAPIView, 'type=bicycle').order_by('id')[:page]),
+            ('products ?category=', 'api_product', 'product_category_id_idx',
+             self._view_queryset(ProductListAPIView, f'category={category_id}').order_by('id')[:page]),
+            ('products ?min_price=&max_price=', 'api_product', 'product_price_idx',
+             self._view_queryset(ProductListAPIView, 'min_price=100&max_price=200').order_by('id')[:page]),
+            ('gear-discounts', 'api_product', 'product_discounted_idx',
+             self._view_queryset(TopDiscountedGearAPIView)),
+            ('top-bicycles', 'api_bicyclesale', 'bicyclesale_bicycle_qty_idx',
+             leaderboard.top_sales_queryset(3)),
+            ('top-bicycles ?window=7', 'api_bicyclesale', 'bicyclesale_sale_date_idx',
+             leaderboard.top_sales_queryset(3, window=7)),
+            ('cart hydration', 'api_product', 'api_product_pkey',
+             Product.objects.with_details().filter(pk__in=product_ids)),
+        ]
+
+    def _explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        # SQLite devuelve (id, parent, notused, detalle); PostgreSQL una columna de texto
+        return [row[-1] for row in rows]
+
+    def _full_scan(self, plan, table):
+        if connection.vendor == 'sqlite':
+            return any(
+                line.startswith(f'SCAN {table}') and 'USING' not in line
+                for line in plan
+            )
+        return any(f'Seq Scan on {table}' in line for line in plan)
+
+    def _uses_index(self, plan, index):
+        if connection.vendor == 'sqlite' and index.endswith('_pkey'):
+            # SQLite no nombra la clave primaria: SEARCH ... USING INTEGER PRIMARY KEY
+            return any('PRIMARY KEY' in line for line in plan)
+        # PostgreSQL: "Index Scan using <índice>", "Bitmap Index Scan on <índice>";
+        # SQLite: "SEARCH <tabla> USING INDEX <índice>"
+        return any(f' {index} ' in f' {line} ' for line in plan)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'Base de datos no soportada: {connection.vendor}')
+
+        missing = []
+        with transaction.atomic():
+            if options['force_index'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, table, index, queryset in self._queries():
+                plan = self._explain(queryset)
+                if self._uses_index(plan, index):
+                    self.stdout.write(self.style.SUCCESS(f'  INDEX {name} ({index})'))
+                else:
+                    missing.append(f'{name} (esperado {index})')
+                    label = 'SEQ  ' if self._full_scan(plan, table) else 'OTRO '
+                    self.stdout.write(self.style.WARNING(f'  {label} {name}: no usa {index}'))
+                if options['plans']:
+                    for line in plan:
+                        self.stdout.write(f'        {line}')
+
+        if missing and options['check']:
+            raise CommandError(
+                'Consultas que no usan su índice: ' + ', '.join(missing)
+            )
@@ -0,0 +1,47 @@
+"""
+Comando para exportar el catálogo a NDJSON o CSV (ver api/utils/catalog_io.py).
+
+Recorre los productos con un cursor del servidor (iterator) y escribe fila
+por fila, así que la memoria no crece con el tamaño del catálogo. La salida
+se puede volver a cargar con ``import_catalog``.
+"""
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.catalog_io import FORMATS, detect_format, export_rows, writer_for
+
+
+class Command(BaseCommand):
+    help = 'Exporta el catálogo (productos, categorías y bicicletas) a NDJSON o CSV en streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help="Archivo de salida ('-' para stdout, default)")
+        parser.add_argument('--format', choices=FORMATS, help='Formato de salida (default: según la extensión, o ndjson)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Filas por lectura del cursor (default: 2000)')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = detect_format(output, options['format'])
+        to_stdout = output == '-'
+
+        stream = sys.stdout if to_stdout else open(output, 'w', newline='', encoding='utf-8')
+        exported = 0
+        start = time.perf_counter()
+        try:
+            writer = writer_for(stream, fmt)
+            for row in export_rows(options['chunk_size']):
+                writer.write(row)
+                exported += 1
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        # Con stdout el resumen va a stderr para no mezclarse con los datos
+        summary = self.stderr if to_stdout else self.stdout
+        summary.write(
+            self.style.SUCCESS(
+                f'✅ Exportados {exported} productos en {time.perf_counter() - start:.1f}s'
+            )
+        )
@@ -0,0 +1,187 @@
+"""
+Comando para generar un catálogo sintético grande (categorías, productos,
+bicicletas, usuarios con perfil y ventas) con bulk_create por lotes.
+
+Con la misma semilla genera siempre los mismos datos, así que sirve para
+reproducir localmente el comportamiento con volumen de producción y para
+preparar la base de ``load_test`` y ``explain_queries``.
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Bicycle, BicycleSale, Category, Product, UserProfile
+from api.utils import leaderboard, product_snapshots
+from api.utils.catalog_cache import bump_catalog_version, bump_stock_version
+
+BIKE_TYPES = ['montaña', 'urbana', 'ruta', 'gravel', 'eléctrica', 'bmx']
+COLORS = ['rojo', 'negro', 'blanco', 'azul', 'verde', 'gris']
+MATERIALS = ['Aluminum', 'Carbon Fiber', 'Steel', 'Titanium']
+WHEEL_SIZES = [20, 24, 26, 27, 29]
+
+
+@contextmanager
+def _sale_date_assignable():
+    """bulk_create respeta auto_now_add; se desactiva para poder repartir las fechas"""
+    field = BicycleSale._meta.get_field('sale_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Genera un catálogo sintético grande y determinista para pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Categorías (default: 20)')
+        parser.add_argument('--products', type=int, default=10000, help='Productos (default: 10000)')
+        parser.add_argument('--users', type=int, default=100, help='Usuarios con perfil (default: 100)')
+        parser.add_argument('--sales', type=int, default=50000, help='Ventas de bicicletas (default: 50000)')
+        parser.add_argument('--days', type=int, default=60, help='Días sobre los que se reparten las ventas (default: 60)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla del generador (default: 42)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Filas por INSERT (default: 1000)')
+        parser.add_argument('--user-prefix', default='loadtest', help='Prefijo de los usuarios generados')
+        parser.add_argument('--password', default='loadtest123', help='Contraseña de los usuarios generados')
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Borrar antes el catálogo, las ventas y los usuarios generados existentes',
+        )
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() and not options['force']:
+            self.stdout.write(
+                self.style.WARNING(
+                    'Los productos ya existen en la base de datos. '
+                    'Usa --force para reemplazarlos.'
+                )
+            )
+            return
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            if options['force']:
+                self.stdout.write('Limpiando datos existentes...')
+                BicycleSale.objects.all().delete()
+                Product.objects.all().delete()
+                Category.objects.all().delete()
+                User.objects.filter(username__startswith=f"{options['user_prefix']}-").delete()
+
+            categories = self._create_categories(options['categories'], batch_size)
+            products = self._create_products(rng, categories, options['products'], batch_size)
+            bicycles = self._create_bicycles(rng, products, batch_size)
+            users = self._create_users(options['users'], options['user_prefix'], options['password'], batch_size)
+            sales = self._create_sales(rng, bicycles, users, options['sales'], options['days'], batch_size)
+
+            # bulk_create no dispara señales: invalidar el cache a mano
+            bump_catalog_version()
+            bump_stock_version()
+            transaction.on_commit(product_snapshots.forget_all)
+
+        self.stdout.write('Reconstruyendo ranking de bicicletas...')
+        leaderboard.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Catálogo generado (semilla {options["seed"]})\n'
+                f'Categorías: {len(categories)}\n'
+                f'Productos: {len(products)} (bicicletas: {len(bicycles)})\n'
+                f'Usuarios: {len(users)} ({options["user_prefix"]}-N / {options["password"]})\n'
+                f'Ventas: {sales}'
+            )
+        )
+
+    def _create_categories(self, count, batch_size):
+        return Category.objects.bulk_create(
+            [Category(name=f'Categoría {index}') for index in range(count)],
+            batch_size=batch_size,
+        )
+
+    def _create_products(self, rng, categories, count, batch_size):
+        products = []
+        for index in range(count):
+            is_bicycle = rng.random() < 0.4
+            products.append(Product(
+                name=f'{"Bicicleta" if is_bicycle else "Accesorio"} {index}',
+                price=Decimal(rng.randint(500, 300000)) / 100,
+                description=f'Producto generado {index}',
+                category=rng.choice(categories),
+                stock=rng.randint(0, 500),
+                type='bicycle' if is_bicycle else 'accessory',
+                # La mayoría sin descuento, como en el catálogo real
+                discount=rng.choice([0] * 8 + [5, 10, 15, 20, 30, 50]),
+            ))
+        created = []
+        for start in range(0, len(products), batch_size):
+            created.extend(Product.objects.bulk_create(products[start:start + batch_size]))
+            self.stdout.write(f'  Productos: {len(created)}/{count}')
+        return created
+
+    def _create_bicycles(self, rng, products, batch_size):
+        return Bicycle.objects.bulk_create(
+            [
+                Bicycle(
+                    product=product,
+                    bike_type=rng.choice(BIKE_TYPES),
+                    wheel_size=rng.choice(WHEEL_SIZES),
+                    color=rng.choice(COLORS),
+                    material=rng.choice(MATERIALS),
+                    weight=Decimal(rng.randint(700, 2500)) / 100,
+                )
+                for product in products if product.type == 'bicycle'
+            ],
+            batch_size=batch_size,
+        )
+
+    def _create_users(self, count, prefix, password, batch_size):
+        # Un solo hash para todos: calcularlo por usuario tardaría minutos
+        password_hash = make_password(password)
+        users = User.objects.bulk_create(
+            [
+                User(username=f'{prefix}-{index}', email=f'{prefix}-{index}@example.com', password=password_hash)
+                for index in range(count)
+            ],
+            batch_size=batch_size,
+        )
+        # Crédito alto para que las compras de la prueba de carga no se agoten
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, credit=Decimal('10000000.00')) for user in users],
+            batch_size=batch_size,
+        )
+        return users
+
+    def _create_sales(self, rng, bicycles, users, count, days, batch_size):
+        if not bicycles or not users:
+            return 0
+        now = timezone.now()
+        # Distribución sesgada: unas pocas bicicletas concentran las ventas
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(bicycles))))
+        created = 0
+        with _sale_date_assignable():
+            while created < count:
+                size = min(batch_size, count - created)
+                chosen = rng.choices(bicycles, cum_weights=cum_weights, k=size)
+                BicycleSale.objects.bulk_create([
+                    BicycleSale(
+                        bicycle=bicycle,
+                        user=rng.choice(users),
+                        quantity=rng.randint(1, 3),
+                        sale_date=now - timedelta(seconds=rng.randint(0, days * 24 * 60 * 60)),
+                    )
+                    for bicycle in chosen
+                ])
+                created += size
+                self.stdout.write(f'  Ventas: {created}/{count}')
+        return created
@@ -0,0 +1,145 @@
+"""
+Comando para importar el catálogo desde NDJSON o CSV (ver api/utils/catalog_io.py).
+
+A diferencia de ``loaddata`` no carga el archivo completo en memoria ni
+guarda fila por fila: lee en streaming y hace upsert por lotes con
+bulk_create(update_conflicts=True) sobre Category, Product y Bicycle, cada
+lote en su propia transacción. Los productos se identifican por id, así que
+reimportar un export actualiza en lugar de duplicar. Si un producto pasa de
+bicicleta a accesorio se borra su fila Bicycle (y con ella, por CASCADE,
+sus ventas de bicicleta).
+
+bulk_create no dispara señales, así que al final se invalidan a mano el
+cache del catálogo y las instantáneas de producto, y se sincronizan los
+contadores de reservas de stock.
+"""
+import sys
+import time
+
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DatabaseError, connection, transaction
+
+from api.models import Bicycle, Category, Product
+from api.utils import product_snapshots, stock_reservations
+from api.utils.catalog_cache import bump_catalog_version, bump_stock_version
+from api.utils.catalog_io import BICYCLE_FIELDS, FORMATS, InvalidRecord, detect_format, read_records
+
+PRODUCT_UPDATE_FIELDS = ['name', 'price', 'description', 'category', 'image_url', 'stock', 'type', 'discount']
+
+
+class Command(BaseCommand):
+    help = 'Importa (upsert por id) el catálogo desde un archivo NDJSON o CSV en streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Archivo a importar ('-' para stdin)")
+        parser.add_argument('--format', choices=FORMATS, help='Formato del archivo (default: según la extensión)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Productos por lote (default: 1000)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        batch_size = options['batch_size']
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        imported = 0
+        start = time.perf_counter()
+        try:
+            batch = []
+            for record in read_records(stream, fmt):
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    imported += self._flush(batch)
+                    batch = []
+                    self._progress(imported, start)
+            if batch:
+                imported += self._flush(batch)
+                self._progress(imported, start)
+        except (InvalidRecord, DatabaseError) as e:
+            prefix = 'Error de base de datos: ' if isinstance(e, DatabaseError) else ''
+            if imported:
+                # Los lotes anteriores ya se confirmaron; sin ocultar el error original
+                try:
+                    self._after_import()
+                except (DatabaseError, redis.RedisError) as cleanup_error:
+                    self.stderr.write(f'No se pudieron invalidar los caches: {cleanup_error}')
+            raise CommandError(f'{prefix}{e}. Productos importados antes del error: {imported}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if imported:
+            self._after_import()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✅ Importación completada: {imported} productos en {time.perf_counter() - start:.1f}s'
+            )
+        )
+
+    def _progress(self, imported, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'  Productos: {imported} ({imported / elapsed:.0f}/s)')
+
+    def _flush(self, records):
+        # Dentro del lote gana la última aparición de cada id
+        categories = {record['category_id']: record['category'] for record in records}
+        products = {}
+        bicycles = {}
+        for record in records:
+            products[record['id']] = Product(
+                id=record['id'],
+                name=record['name'],
+                price=record['price'],
+                description=record['description'],
+                category_id=record['category_id'],
+                image_url=record['image_url'],
+                stock=record['stock'],
+                type=record['type'],
+                discount=record['discount'],
+            )
+            if record['bicycle']:
+                bicycles[record['id']] = Bicycle(product_id=record['id'], **record['bicycle'])
+
+        # En orden de dependencias: categoría → producto → bicicleta
+        with transaction.atomic():
+            Category.objects.bulk_create(
+                [Category(id=pk, name=name) for pk, name in categories.items()],
+                update_conflicts=True, unique_fields=['id'], update_fields=['name'],
+            )
+            Product.objects.bulk_create(
+                list(products.values()),
+                update_conflicts=True, unique_fields=['id'], update_fields=PRODUCT_UPDATE_FIELDS,
+            )
+            if bicycles:
+                Bicycle.objects.bulk_create(
+                    list(bicycles.values()),
+                    update_conflicts=True, unique_fields=['product'], update_fields=BICYCLE_FIELDS,
+                )
+            # Productos que dejaron de ser bicicleta
+            Bicycle.objects.filter(
+                product_id__in=[pk for pk, product in products.items() if product.type != 'bicycle']
+            ).delete()
+
+        if settings.STOCK_RESERVATIONS_ENABLED:
+            try:
+                stock_reservations.sync_stock({pk: product.stock for pk, product in products.items()})
+            except redis.RedisError:
+                self.stdout.write(self.style.WARNING(
+                    '  Redis no disponible: ejecuta reconcile_stock_reservations al terminar'
+                ))
+        return len(products)
+
+    def _after_import(self):
+        # Los ids explícitos no avanzan las secuencias de PostgreSQL
+        statements = connection.ops.sequence_reset_sql(no_style(), [Category, Product])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+        bump_catalog_version()
+        bump_stock_version()
+        product_snapshots.forget_all()
@@ -0,0 +1,201 @@
+"""
+Comando de prueba de carga contra una instancia en ejecución (por ejemplo
+el stack de docker-compose en http://localhost:8000).
+
+Cada usuario virtual inicia sesión con un usuario de ``generate_catalog`` y
+repite el recorrido de compra: navegar el catálogo → agregar al carrito →
+ver el carrito → checkout. Al final reporta, por endpoint, peticiones,
+errores, throughput y percentiles de latencia.
+
+Con ``--async`` el catálogo y el carrito usan las vistas asíncronas
+(/api/async/...), para comparar el stack síncrono con SERVER_MODE=asgi. El
+login y el checkout no tienen versión asíncrona y son los mismos en ambos.
+
+Solo usa la librería estándar (urllib + hilos), así que no necesita
+dependencias extra ni acceso a la base de datos.
+"""
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(sorted_values, percent):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, status, elapsed):
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.statuses[name][status] += 1
+
+
+class _VirtualUser:
+    def __init__(self, base_url, username, password, stats, timeout, rng, prefix='/api'):
+        self.base_url = base_url.rstrip('/')
+        self.prefix = prefix
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.timeout = timeout
+        self.rng = rng
+        self.token = None
+
+    def request(self, name, method, path, data=None, headers=None):
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        request.add_header('Accept', 'application/json')
+        if body is not None:
+            request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        for header, value in (headers or {}).items():
+            request.add_header(header, value)
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            status, payload = 'error', b''
+        self.stats.record(name, status, time.perf_counter() - start)
+
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+    def login(self):
+        status, data = self.request(
+            'login', 'POST', '/api/login/',
+            {'username': self.username, 'password': self.password}
+        )
+        if status != 200:
+            return False
+        self.token = data['access_token']
+        return True
+
+    def scenario(self):
+        status, data = self.request('browse', 'GET', f'{self.prefix}/products/?type=bicycle')
+        if status != 200:
+            return
+        in_stock = [product for product in data['results'] if product['stock'] > 0]
+        if not in_stock:
+            return
+        product = self.rng.choice(in_stock)
+
+        status, _ = self.request('cart_add', 'POST', f'{self.prefix}/cart/add/', {'product_id': product['id'], 'quantity': 1})
+        if status != 200:
+            return
+
+        status, cart = self.request('cart_view', 'GET', f'{self.prefix}/cart/view/')
+        if status != 200 or not cart['items']:
+            return
+
+        items = [{'product_id': item['id'], 'quantity': item['quantity']} for item in cart['items']]
+        self.request(
+            'checkout', 'POST', '/api/buy/checkout/',
+            {'items': items, 'total': cart['total_amount']},
+            headers={'Idempotency-Key': uuid.uuid4().hex}
+        )
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga del recorrido de compra (catálogo → carrito → checkout) contra una URL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000', help='URL del backend (default: http://localhost:8000)')
+        parser.add_argument('--users', type=int, default=20, help='Usuarios virtuales concurrentes (default: 20)')
+        parser.add_argument('--iterations', type=int, default=10, help='Recorridos por usuario (default: 10)')
+        parser.add_argument('--user-prefix', default='loadtest', help='Prefijo de los usuarios de generate_catalog')
+        parser.add_argument('--password', default='loadtest123', help='Contraseña de los usuarios de generate_catalog')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout por petición en segundos (default: 30)')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla para elegir productos (default: 42)')
+        parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help='Catálogo y carrito por /api/async/ (servidor con SERVER_MODE=asgi)'
+        )
+
+    def handle(self, *args, **options):
+        stats = _Stats()
+        virtual_users = [
+            _VirtualUser(
+                options['base_url'], f"{options['user_prefix']}-{index}", options['password'],
+                stats, options['timeout'], random.Random(options['seed'] + index),
+                prefix='/api/async' if options['use_async'] else '/api'
+            )
+            for index in range(options['users'])
+        ]
+
+        def run(virtual_user):
+            if not virtual_user.login():
+                return
+            for _ in range(options['iterations']):
+                virtual_user.scenario()
+
+        self.stdout.write(
+            f"Ejecutando {options['users']} usuarios x {options['iterations']} recorridos "
+            f"contra {options['base_url']}{' (vistas async)' if options['use_async'] else ''}..."
+        )
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['users']) as executor:
+            list(executor.map(run, virtual_users))
+        duration = time.perf_counter() - start
+
+        if not stats.latencies.get('login') or stats.statuses['login'].get(200, 0) == 0:
+            raise CommandError(
+                'Ningún usuario pudo iniciar sesión. ¿Se ejecutó generate_catalog con los mismos '
+                '--user-prefix y --password?'
+            )
+
+        self._report(stats, duration)
+
+    def _report(self, stats, duration):
+        header = f"{'endpoint':<12}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  status"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        total_requests = 0
+        for name in ('login', 'browse', 'cart_add', 'cart_view', 'checkout'):
+            latencies = sorted(stats.latencies.get(name, []))
+            if not latencies:
+                continue
+            statuses = stats.statuses[name]
+            errors = sum(
+                count for status, count in statuses.items()
+                if status == 'error' or status >= 400
+            )
+            total_requests += len(latencies)
+            status_summary = ' '.join(f'{status}:{count}' for status, count in sorted(statuses.items(), key=str))
+            self.stdout.write(
+                f"{name:<12}{len(latencies):>7}{errors:>8}{len(latencies) / duration:>9.1f}"
+                f"{_percentile(latencies, 50) * 1000:>9.1f}{_percentile(latencies, 95) * 1000:>9.1f}"
+                f"{_percentile(latencies, 99) * 1000:>9.1f}{latencies[-1] * 1000:>9.1f}  {status_summary}"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Total: {total_requests} peticiones en {duration:.1f}s '
+                f'({total_requests / duration:.1f} req/s)'
+            )
+        )
@@ -0,0 +1,16 @@
+"""
+Comando para reconstruir el ranking de bicicletas más vendidas en Redis
+"""
+from django.core.management.base import BaseCommand
+from api.utils import leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde BicycleSale los rankings de bicicletas más vendidas en Redis'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Reconstruyendo ranking de bicicletas...')
+        total = leaderboard.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f'Ranking reconstruido. Bicicletas en el ranking: {total}')
+        )
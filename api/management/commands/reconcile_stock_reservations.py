@@ -0,0 +1,47 @@
+"""
+Comando para recalcular los contadores de reservas de stock desde PostgreSQL
+"""
+from django.core.management.base import BaseCommand
+
+from api.models import Product
+from api.utils import stock_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula en Redis las unidades disponibles de cada producto como '
+        'stock en la base de datos menos las reservas activas de los carritos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Productos por llamada al script de Redis (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        synced = 0
+        reclaimed = 0
+        batch = {}
+
+        self.stdout.write('Reconciliando reservas de stock...')
+        products = Product.objects.order_by('pk').values_list('pk', 'stock')
+        for product_id, stock in products.iterator(chunk_size=batch_size):
+            batch[product_id] = stock
+            if len(batch) >= batch_size:
+                reclaimed += stock_reservations.sync_stock(batch)
+                synced += len(batch)
+                batch = {}
+        if batch:
+            reclaimed += stock_reservations.sync_stock(batch)
+            synced += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Reconciliación completada. Productos: {synced}, '
+                f'reservas vencidas liberadas: {reclaimed}'
+            )
+        )
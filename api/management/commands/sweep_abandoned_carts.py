@@ -0,0 +1,107 @@
+"""
+Comando periódico (p. ej. cron cada 15 minutos) para los carritos que van a
+expirar por CART_TTL.
+
+- Con CART_ARCHIVE_ENABLED: guarda en AbandonedCart, con el total al precio
+  actual, los carritos cuya expiración cae dentro de --window, y recién
+  después los borra de Redis (si falla la base de datos, siguen ahí). Si un
+  usuario vuelve a usar su carrito entre ambos pasos, el carrito se queda y
+  su fila archivada se descarta. --window debe ser mayor que el intervalo
+  entre ejecuciones; si no, algunos carritos expiran antes de archivarse.
+- Sin archivado: Redis ya los expira solo, y el comando únicamente limpia
+  del índice carts:activity a los usuarios cuyos carritos expiraron.
+
+Las reservas de stock de esos carritos no se tocan: duran
+CART_RESERVATION_TTL, mucho menos que CART_TTL, y ya vencieron.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from api.models import AbandonedCart
+from api.utils import cart_store, pricing
+
+
+class Command(BaseCommand):
+    help = 'Archiva en PostgreSQL los carritos abandonados antes de que expiren en Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window',
+            type=int,
+            default=3600,
+            help='Archivar los carritos que expiran en los próximos N segundos (default: 3600)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Carritos por lote (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        ttl = settings.CART_TTL
+        if not ttl:
+            self.stdout.write(self.style.WARNING('CART_TTL es 0: los carritos no expiran, nada que hacer'))
+            return
+
+        now = time.time()
+        if not settings.CART_ARCHIVE_ENABLED:
+            pruned = cart_store.prune_activity(now - ttl)
+            self.stdout.write(
+                self.style.SUCCESS(f'Archivado deshabilitado. Carritos expirados quitados del índice: {pruned}')
+            )
+            return
+
+        cutoff = now + options['window'] - ttl
+        archived = 0
+        discarded = 0
+        while True:
+            idle = cart_store.idle_carts(cutoff, options['batch_size'])
+            if not idle:
+                break
+            rows = self._build_rows(idle)
+            AbandonedCart.objects.bulk_create(rows)
+
+            # Solo después de archivar se borran de Redis
+            deleted = set(cart_store.delete_idle_carts([user_id for user_id, _, _ in idle], cutoff))
+            reused = [row.pk for row in rows if row.user_id not in deleted]
+            if reused:
+                AbandonedCart.objects.filter(pk__in=reused).delete()
+            archived += len(rows) - len(reused)
+            discarded += len(idle) - len(rows)
+            self.stdout.write(f'  Archivados: {archived}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Barrido completado. Carritos archivados: {archived}, '
+                f'vacíos o sin usuario descartados: {discarded}'
+            )
+        )
+
+    def _build_rows(self, idle):
+        user_ids = set(
+            User.objects.filter(pk__in=[user_id for user_id, _, _ in idle]).values_list('pk', flat=True)
+        )
+        prices = pricing.load_prices({
+            product_id for _, _, lines in idle for product_id in lines
+        })
+
+        rows = []
+        for user_id, last_activity, lines in idle:
+            if not lines or user_id not in user_ids:
+                continue
+            _, total = pricing.cart_total(
+                {int(product_id): quantity for product_id, quantity in lines.items()}, prices
+            )
+            rows.append(AbandonedCart(
+                user_id=user_id,
+                items=lines,
+                total_quantity=sum(lines.values()),
+                total_amount=total,
+                last_activity=datetime.fromtimestamp(last_activity, tz=dt_timezone.utc),
+            ))
+        return rows
@@ -0,0 +1,110 @@
+"""
+Middlewares del app api
+"""
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from api.utils import compression, log_context, metrics
+
+logger = logging.getLogger('api.metrics')
+
+
+class RequestMetricsMiddleware:
+    """
+    Mide cada request (tiempo total, consultas SQL y su tiempo, comandos Redis
+    y su tiempo, tamaño de la respuesta), lo registra como una línea de log
+    JSON y lo agrega por ruta para /api/metrics/.
+
+    También fija el id de correlación del request (X-Request-ID recibido o uno
+    nuevo), disponible en los logs como %(request_id)s y devuelto en la respuesta.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request_id, id_token = log_context.start_request_id(
+            request.headers.get(log_context.REQUEST_ID_HEADER)
+        )
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self._finish(request, response, stats, time.perf_counter() - start, request_id)
+        finally:
+            metrics.end_request(token)
+            log_context.end_request_id(id_token)
+        return response
+
+    async def __acall__(self, request):
+        request_id, id_token = log_context.start_request_id(
+            request.headers.get(log_context.REQUEST_ID_HEADER)
+        )
+        stats, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self._finish(request, response, stats, time.perf_counter() - start, request_id)
+        finally:
+            metrics.end_request(token)
+            log_context.end_request_id(id_token)
+        return response
+
+    def _finish(self, request, response, stats, duration, request_id):
+        response[log_context.REQUEST_ID_HEADER] = request_id
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+
+        metrics.observe(route, request.method, response.status_code, duration, size, stats)
+
+        if settings.METRICS_LOG_REQUESTS and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "event": "request",
+                "request_id": request_id,
+                "route": route,
+                "method": request.method,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "db_queries": stats.db_queries,
+                "db_ms": round(stats.db_time * 1000, 2),
+                "redis_commands": stats.redis_commands,
+                "redis_ms": round(stats.redis_time * 1000, 2),
+                "response_bytes": size,
+            }))
+
+
+class CompressionMiddleware:
+    """
+    Comprime con gzip o brotli las respuestas JSON grandes (ver
+    api/utils/compression.py). Las del catálogo llegan ya comprimidas desde
+    su cache y se dejan pasar tal cual.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return compression.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compression.compress_response(request, await self.get_response(request))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('description', models.TextField(blank=True)),
+                ('image_url', models.URLField(blank=True)),
+                ('stock', models.IntegerField(default=0)),
+                ('type', models.CharField(choices=[('bicycle', 'Bicycle'), ('accessory', 'Accessory')], max_length=20)),
+                ('discount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Bicycle',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.product')),
+                ('bike_type', models.CharField(max_length=50)),
+                ('wheel_size', models.IntegerField()),
+                ('color', models.CharField(max_length=50)),
+                ('material', models.CharField(max_length=50)),
+                ('weight', models.DecimalField(blank=True, decimal_places=2, max_digits=5)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.category'),
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credit', models.DecimalField(decimal_places=2, default=1000.0, max_digits=10)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BicycleSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('sale_date', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('bicycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.bicycle')),
+            ],
+        ),
+    ]
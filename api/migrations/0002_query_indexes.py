@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bicyclesale',
+            index=models.Index(fields=['bicycle', 'quantity'], name='bicyclesale_bicycle_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bicyclesale',
+            index=models.Index(fields=['sale_date'], name='bicyclesale_sale_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['type', 'id'], name='product_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('discount__gt', 0)), fields=['-discount'], name='product_discounted_idx'),
+        ),
+    ]
@@ -14,6 +14,12 @@ class UserProfile(models.Model):
 class Category(models.Model):
     name = models.CharField(max_length=50)
 
+class ProductQuerySet(models.QuerySet):
+    def with_details(self):
+        """Plan de carga para ProductWithDetailsSerializer: categoría y bicicleta en el mismo JOIN"""
+        return self.select_related('category', 'bicycle')
+
+
 class Product(models.Model):
     PRODUCT_TYPES = [
         ('bicycle', 'Bicycle'),
@@ -22,12 +28,31 @@ class Product(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=7, decimal_places=2)
     description = models.TextField(blank=True)
-    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    # Sin el índice propio de la FK: product_category_id_idx (category, id)
+    # ya lo cubre, y con los dos el planner elegía el simple y ordenaba
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=False)
     image_url = models.URLField(blank=True)
     stock = models.IntegerField(default=0)
     type = models.CharField(max_length=20, choices=PRODUCT_TYPES)
     discount = models.IntegerField(default=0)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Filtros del listado paginado por cursor (ORDER BY id)
+            models.Index(fields=['type', 'id'], name='product_type_id_idx'),
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            # Accesorios en oferta: WHERE discount > 0 ORDER BY discount DESC.
+            # Parcial: solo indexa los productos con descuento
+            models.Index(
+                fields=['-discount'],
+                name='product_discounted_idx',
+                condition=models.Q(discount__gt=0),
+            ),
+        ]
+
 class Bicycle(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
     bike_type = models.CharField(max_length=50)  # montaña, urbana, etc.
@@ -40,4 +65,27 @@ class BicycleSale(models.Model):
     bicycle = models.ForeignKey(Bicycle, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=0)
-    sale_date = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    sale_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Ranking de más vendidas: GROUP BY bicycle con SUM(quantity)
+            # se resuelve solo con el índice (index-only scan)
+            models.Index(fields=['bicycle', 'quantity'], name='bicyclesale_bicycle_qty_idx'),
+            # Ventanas de 7 y 30 días
+            models.Index(fields=['sale_date'], name='bicyclesale_sale_date_idx'),
+        ]
+
+class AbandonedCart(models.Model):
+    """Carrito archivado por sweep_abandoned_carts antes de expirar en Redis"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    items = models.JSONField()  # {product_id: quantity}
+    total_quantity = models.PositiveIntegerField()
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    last_activity = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['archived_at'], name='abandonedcart_archived_idx'),
+        ]
@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Paginación por cursor (keyset) sobre el id del producto.
+    Cada página es un WHERE id > cursor ORDER BY id LIMIT n, así que su costo
+    no depende de qué tan profundo se haya desplazado el cliente.
+    """
+    ordering = 'id'
+    page_size = settings.PRODUCTS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.PRODUCTS_MAX_PAGE_SIZE
@@ -0,0 +1,56 @@
+"""
+Renderer JSON rápido para DRF.
+
+Con orjson instalado, FastJSONRenderer serializa en C y produce los mismos
+bytes que rest_framework.renderers.JSONRenderer con la configuración por
+defecto (JSON compacto, UTF-8 sin escapar, \\u2028 y \\u2029 escapados).
+Lo que orjson no sabe serializar igual que DRF (fechas, decimales, textos
+traducibles) pasa por el encoder de DRF. Sin orjson, o con indentación
+(navegador de DRF, ``Accept: application/json; indent=4``), se usa el
+renderer original.
+
+Se activa con FAST_JSON_ENABLED (ver REST_FRAMEWORK en settings).
+"""
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Las fechas, los decimales y los textos traducibles los resuelve el encoder de DRF
+_drf_default = encoders.JSONEncoder().default
+
+_LINE_SEPARATOR = '\u2028'.encode()
+_PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=_drf_default,
+                # DRF formatea las fechas a su manera (ej. "Z" en lugar de "+00:00")
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            # Enteros de más de 64 bits, tipos raros: el camino de siempre
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Igual que JSONRenderer: la salida debe ser un subconjunto estricto de JavaScript
+        if _LINE_SEPARATOR in ret or _PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(_LINE_SEPARATOR, b'\\u2028').replace(_PARAGRAPH_SEPARATOR, b'\\u2029')
+        return ret
+
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.db import models
 from .models import Product, Category, Bicycle
+from .utils.pricing import unit_price
 
 # serializers.py
 from rest_framework import serializers
@@ -23,13 +24,102 @@ class BicycleSerializer(serializers.ModelSerializer):
         model = Bicycle
         fields = ['bike_type','wheel_size','color','material','weight']
 
-class ProductWithDetailsSerializer(serializers.ModelSerializer):
+def requested_fields(request, available):
+    """Campos de ?fields= presentes en available (en su orden), o None si se piden todos"""
+    if request is None:
+        return None
+    requested = request.query_params.get('fields')
+    if not requested:
+        return None
+    allowed = {name.strip() for name in requested.split(',') if name.strip()}
+    selected = [field_name for field_name in available if field_name in allowed]
+    return selected or None
+
+class SparseFieldsMixin:
+    """
+    Permite pedir solo algunos campos con ?fields=id,name,price.
+    Los nombres desconocidos se ignoran; sin el parámetro se devuelven todos.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = requested_fields(self.context.get('request'), list(self.fields))
+        if selected is None:
+            return
+        for field_name in set(self.fields) - set(selected):
+            self.fields.pop(field_name)
+
+class ProductWithDetailsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     bicycle = BicycleSerializer(read_only=True)
+    final_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'price', 'description', 'image_url',
-            'stock', 'category', 'type', 'bicycle', 'discount'
-        ]
\ No newline at end of file
+            'stock', 'category', 'type', 'bicycle', 'discount', 'final_price'
+        ]
+
+    def get_final_price(self, obj):
+        """Precio con descuento, calculado igual que en el carrito y el checkout"""
+        return str(unit_price(obj.price, obj.discount))
+
+# Columnas de values() que necesita ProductRowSerializer (mismo JOIN que with_details())
+PRODUCT_ROW_VALUES = (
+    'id', 'name', 'price', 'description', 'image_url', 'stock', 'type', 'discount',
+    'category_id', 'category__name', 'bicycle__pk', 'bicycle__bike_type',
+    'bicycle__wheel_size', 'bicycle__color', 'bicycle__material', 'bicycle__weight',
+)
+
+def _decimal(value):
+    # Igual que DecimalField con COERCE_DECIMAL_TO_STRING
+    return None if value is None else '{:f}'.format(value)
+
+class ProductRowSerializer:
+    """
+    Serializa filas de queryset.values(*PRODUCT_ROW_VALUES) con exactamente la
+    misma salida que ProductWithDetailsSerializer (incluido ?fields=), sin
+    instanciar modelos ni recorrer campos de DRF. Solo lectura.
+    """
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.fields = requested_fields((context or {}).get('request'), ProductWithDetailsSerializer.Meta.fields)
+
+    @staticmethod
+    def to_representation(row):
+        price = row['price']
+        bicycle = None
+        if row['bicycle__pk'] is not None:
+            bicycle = {
+                'bike_type': row['bicycle__bike_type'],
+                'wheel_size': row['bicycle__wheel_size'],
+                'color': row['bicycle__color'],
+                'material': row['bicycle__material'],
+                'weight': _decimal(row['bicycle__weight']),
+            }
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'price': _decimal(price),
+            'description': row['description'],
+            'image_url': row['image_url'],
+            'stock': row['stock'],
+            'category': {'id': row['category_id'], 'name': row['category__name']},
+            'type': row['type'],
+            'bicycle': bicycle,
+            'discount': row['discount'],
+            'final_price': str(unit_price(price, row['discount'])),
+        }
+
+    @property
+    def data(self):
+        to_representation = self.to_representation
+        if self.fields is None:
+            return [to_representation(row) for row in self.rows]
+        fields = self.fields
+        return [
+            {field_name: item[field_name] for field_name in fields}
+            for item in map(to_representation, self.rows)
+        ]
@@ -0,0 +1,65 @@
+"""
+Señales del app api: invalidan el cache del catálogo y el de usuarios cuando
+cambian sus modelos, mantienen los contadores de reservas de stock
+alineados con la base de datos e instrumentan cada conexión nueva para las
+métricas por request
+"""
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import Bicycle, Category, Product, UserProfile
+from api.utils import metrics, product_snapshots, stock_reservations, user_cache
+from api.utils.catalog_cache import bump_catalog_version
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Bicycle)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def sync_reservation_counter(sender, instance, **kwargs):
+    stock_reservations.sync_stock_on_commit(instance.pk, instance.stock)
+
+
+@receiver(post_delete, sender=Product)
+def forget_reservation_counter(sender, instance, **kwargs):
+    stock_reservations.forget_product_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_snapshot(sender, instance, **kwargs):
+    product_snapshots.refresh_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def forget_product_snapshot(sender, instance, **kwargs):
+    product_snapshots.forget_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_snapshots(sender, instance, created, **kwargs):
+    # Una categoría nueva todavía no tiene productos
+    if not created:
+        product_snapshots.refresh_category_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    user_cache.invalidate_profile_on_commit(instance.user_id)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Cada hilo tiene su conexión: las vistas async consultan desde el
+    # executor de sync_to_async, no desde el hilo del event loop
+    metrics.install_db_wrapper(connection)
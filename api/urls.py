@@ -1,10 +1,13 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from .views import ProductListAPIView, TopSellingBicyclesAPIView, TopDiscountedGearAPIView, BuyCheckoutView, UserCreditView, DebugCheckoutView, DebugTokenView, HealthCheckView, LoginView
+from .views import ProductListAPIView, TopSellingBicyclesAPIView, TopDiscountedGearAPIView, BuyCheckoutView, UserCreditView, DebugCheckoutView, DebugTokenView, HealthCheckView, LoginView, PoolStatsView, MetricsView
 from api.utils import cart_views
+from api import async_views
 
 urlpatterns = [
     path('health/', HealthCheckView.as_view(), name='health-check'),
+    path('health/pools/', PoolStatsView.as_view(), name='pool-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('login/', LoginView.as_view(), name='login'),
     path('products/', ProductListAPIView.as_view(), name='product-list'),
     path('top-bicycles/', TopSellingBicyclesAPIView.as_view(), name='top-bicycles'),
@@ -19,5 +22,17 @@ urlpatterns = [
     path('cart/remove/', cart_views.remove_from_cart),
     path('cart/update/', cart_views.update_cart_quantity),
     path('cart/clear/', cart_views.clear_cart),
+    path('cart/batch/', cart_views.batch_update_cart),
+    # Versiones asíncronas (no bloquean el worker bajo ASGI)
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/top-bicycles/', async_views.top_bicycles, name='async-top-bicycles'),
+    path('async/gear-discounts/', async_views.gear_discounts, name='async-gear-discounts'),
+    path('async/cart/view/', async_views.view_cart),
+    path('async/cart/detailed/', async_views.view_cart_detailed),
+    path('async/cart/add/', async_views.add_to_cart),
+    path('async/cart/remove/', async_views.remove_from_cart),
+    path('async/cart/update/', async_views.update_cart_quantity),
+    path('async/cart/clear/', async_views.clear_cart),
+    path('async/cart/batch/', async_views.batch_update_cart),
     # path('', include(router.urls)),
 ]
\ No newline at end of file
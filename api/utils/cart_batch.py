@@ -0,0 +1,78 @@
+"""
+Operaciones por lote sobre el carrito (POST cart/batch/), compartidas por la
+vista síncrona y la asíncrona.
+
+El cuerpo es {"operations": [{"op": "add" | "update" | "remove",
+"product_id": 1, "quantity": 2}, ...]}. Como en cart/add/ y cart/update/, la
+cantidad es absoluta; si un producto aparece varias veces gana la última
+operación. Las operaciones se reducen a líneas {product_id: quantity} donde
+0 significa quitar el producto, que es lo que aplican
+stock_reservations.reserve() y cart_store.apply_batch() de una sola vez.
+"""
+OPERATIONS = ('add', 'update', 'remove')
+MAX_OPERATIONS = 100
+
+
+class InvalidBatch(ValueError):
+    def __init__(self, message, index=None):
+        super().__init__(message)
+        self.message = message
+        self.index = index
+
+    def as_dict(self):
+        error = {"error": self.message}
+        if self.index is not None:
+            error["index"] = self.index
+        return error
+
+
+def parse_operations(data):
+    """Valida las operaciones y devuelve las líneas resultantes {product_id: quantity}"""
+    operations = data.get("operations") if hasattr(data, "get") else None
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("operations debe ser una lista no vacía")
+    if len(operations) > MAX_OPERATIONS:
+        raise InvalidBatch(f"Máximo {MAX_OPERATIONS} operaciones por lote")
+
+    lines = {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise InvalidBatch(f"op debe ser uno de: {', '.join(OPERATIONS)}", index)
+        try:
+            product_id = int(operation.get("product_id"))
+            quantity = 0 if operation["op"] == "remove" else int(operation.get("quantity", 1))
+        except (TypeError, ValueError):
+            raise InvalidBatch("product_id y quantity deben ser enteros", index)
+        if operation["op"] != "remove" and quantity <= 0:
+            raise InvalidBatch("La cantidad debe ser mayor a 0", index)
+        # Reinsertar para que el orden refleje la última operación
+        lines.pop(product_id, None)
+        lines[product_id] = quantity
+    return lines
+
+
+def missing_product(lines, products):
+    """Primer producto agregado o actualizado que no existe en la base de datos, o None"""
+    for product_id, quantity in lines.items():
+        if quantity and product_id not in products:
+            return product_id
+    return None
+
+
+def reservation(lines, products):
+    """
+    Argumentos (lines, stocks) de stock_reservations.reserve() para los
+    productos que existen, y los ids ya borrados que solo hay que liberar
+    """
+    reserve_lines = {product_id: quantity for product_id, quantity in lines.items() if product_id in products}
+    stocks = {product_id: products[product_id].stock for product_id in reserve_lines}
+    gone = [product_id for product_id in lines if product_id not in products]
+    return reserve_lines, stocks, gone
+
+
+def other_lines(cart_data, products):
+    """Líneas del carrito cuyo producto no se cargó con el lote (hay que hidratarlas aparte)"""
+    return {
+        product_id: item for product_id, item in cart_data.items()
+        if not product_id.isdigit() or int(product_id) not in products
+    }
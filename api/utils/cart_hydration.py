@@ -0,0 +1,155 @@
+"""
+Hidratación del carrito: convierte las líneas guardadas en Redis en items
+listos para la respuesta. La vista básica se arma con las instantáneas de
+producto (un HMGET, sin SQL); la detallada usa una sola consulta a la base
+de datos. Los subtotales se calculan con el motor de precios (descuentos
+incluidos).
+"""
+from decimal import Decimal
+
+from api.models import Bicycle, Product
+from api.utils import pricing, product_snapshots
+
+
+def _parse_product_ids(cart_data):
+    """Devuelve los IDs del carrito como enteros, ignorando claves inválidas"""
+    product_ids = []
+    for product_id in cart_data:
+        try:
+            product_ids.append(int(product_id))
+        except (TypeError, ValueError):
+            continue
+    return product_ids
+
+
+def load_cart_products(cart_data):
+    """
+    Carga todos los productos del carrito en una sola consulta, incluyendo
+    categoría y detalles de bicicleta. Devuelve un dict {id: Product}.
+    """
+    product_ids = _parse_product_ids(cart_data)
+    if not product_ids:
+        return {}
+    return Product.objects.with_details().in_bulk(product_ids)
+
+
+async def aload_cart_products(cart_data):
+    """Versión asíncrona de load_cart_products (ORM asíncrono de Django)"""
+    product_ids = _parse_product_ids(cart_data)
+    if not product_ids:
+        return {}
+    return {
+        product.pk: product
+        async for product in Product.objects.with_details().filter(pk__in=product_ids)
+    }
+
+
+def _bicycle_details(product):
+    try:
+        bicycle = product.bicycle
+    except Bicycle.DoesNotExist:
+        return None
+    return {
+        "bike_type": bicycle.bike_type,
+        "wheel_size": bicycle.wheel_size,
+        "color": bicycle.color,
+        "material": bicycle.material,
+        "weight": str(bicycle.weight) if bicycle.weight else None
+    }
+
+
+def _basic_item(product_id, snapshot, cart_item, final_price, subtotal):
+    return {
+        "id": product_id,
+        "name": snapshot["name"],
+        "image_url": snapshot["image_url"],
+        "price": snapshot["price"],
+        "final_price": str(final_price),
+        "quantity": cart_item["quantity"],
+        "category": snapshot["category"],
+        "type": snapshot["type"],
+        "subtotal": str(subtotal),
+        "discount": snapshot["discount"],
+        "stock_status": snapshot["stock_bucket"]
+    }
+
+
+def _detailed_item(product_id, product, cart_item, final_price, subtotal):
+    product_info = {
+        "id": product.id,
+        "name": product.name,
+        "image_url": product.image_url,
+        "price": str(product.price),
+        "final_price": str(final_price),
+        "discount": product.discount,
+        "description": product.description,
+        "quantity": cart_item["quantity"],
+        "category": cart_item.get("category") or product.category.name,
+        "type": product.type,
+        "stock": product.stock,
+        "subtotal": str(subtotal)
+    }
+    # Si es una bicicleta, agregar información específica
+    if product.type == 'bicycle':
+        product_info["bicycle_details"] = _bicycle_details(product)
+    return product_info
+
+
+def _build_items(cart_data, entries, build_item, price_of):
+    """
+    Recorre el carrito en su orden (por product_id), omite los productos que ya no existen y
+    calcula subtotales y total con el motor de precios (mismo cálculo que el
+    checkout). Devuelve (items, total_amount).
+    """
+    enriched_cart = []
+    total_amount = Decimal('0.00')
+    for product_id, cart_item in cart_data.items():
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            continue
+        entry = entries.get(product_id)
+        if entry is None:
+            # Si el producto ya no existe, lo omitimos del carrito
+            continue
+
+        final_price = pricing.unit_price(*price_of(entry))
+        subtotal = final_price * cart_item["quantity"]
+        total_amount += subtotal
+        enriched_cart.append(build_item(product_id, entry, cart_item, final_price, subtotal))
+
+    return enriched_cart, total_amount
+
+
+def build_snapshot_items(cart_data, snapshots):
+    """Items básicos a partir de las instantáneas {id: snapshot}"""
+    return _build_items(cart_data, snapshots, _basic_item, product_snapshots.snapshot_price)
+
+
+def build_cart_items(cart_data, products, detailed=False):
+    """Items a partir de los productos ya cargados ({id: Product})"""
+    if detailed:
+        return _build_items(cart_data, products, _detailed_item, lambda product: (product.price, product.discount))
+    snapshots = {
+        product_id: product_snapshots.snapshot_from_product(product)
+        for product_id, product in products.items()
+    }
+    return build_snapshot_items(cart_data, snapshots)
+
+
+def hydrate_cart(cart_data, detailed=False):
+    """
+    Vista básica: instantáneas en Redis (sin SQL salvo las que falten).
+    Detallada: carga los productos del carrito en una consulta.
+    """
+    if detailed:
+        return build_cart_items(cart_data, load_cart_products(cart_data), detailed=True)
+    snapshots = product_snapshots.get_snapshots(_parse_product_ids(cart_data))
+    return build_snapshot_items(cart_data, snapshots)
+
+
+async def ahydrate_cart(cart_data, detailed=False):
+    if detailed:
+        return build_cart_items(cart_data, await aload_cart_products(cart_data), detailed=True)
+    snapshots = await product_snapshots.aget_snapshots(_parse_product_ids(cart_data))
+    return build_snapshot_items(cart_data, snapshots)
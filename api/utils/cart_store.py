@@ -0,0 +1,375 @@
+"""
+Almacenamiento del carrito en Redis como hash.
+
+Cada línea del carrito es un campo del hash ``cart:{user_id}`` cuyo valor es
+la cantidad, así que cada operación toca un solo campo y es atómica
+(HSET / HINCRBY / HDEL). Los carritos antiguos guardados como JSON en un
+string se migran automáticamente la primera vez que se accede a ellos.
+
+Cada operación renueva en el mismo pipeline la expiración del carrito
+(CART_TTL, deslizante) y su última actividad en el sorted set
+``carts:activity`` (score = timestamp), que usan el comando
+sweep_abandoned_carts y las métricas de carritos vivos.
+
+Las escrituras incrementan además ``cartrev:{user_id}``, la revisión del
+carrito con la que se arma su ETag (ver cart_etag).
+"""
+import json
+import time
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from api.utils.catalog_cache import CATALOG_VERSION_KEY, STOCK_VERSION_KEY
+from api.utils.redis_client import async_redis_client, redis_client
+
+
+# Fuera del patrón cart:* para que clean_redis_carts no lo tome por un carrito
+ACTIVITY_KEY = "carts:activity"
+
+# Borra un carrito (ya archivado) si su última actividad sigue siendo
+# anterior al corte; si el usuario volvió mientras tanto, no se toca.
+# Devuelve 1 si lo borró
+_LUA_CLAIM = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('UNLINK', KEYS[1], KEYS[3])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return 1
+"""
+
+_claim = redis_client.register_script(_LUA_CLAIM)
+
+
+def cart_key(user_id):
+    return f"cart:{user_id}"
+
+
+def revision_key(user_id):
+    return f"cartrev:{user_id}"
+
+
+def _touch(pipe, user_id, create=True):
+    """
+    Encola la renovación del TTL y de la última actividad. Con create=False
+    (lecturas) solo actualiza usuarios que ya están en carts:activity, para
+    no registrar a quien mira un carrito vacío.
+    """
+    if settings.CART_TTL:
+        pipe.expire(cart_key(user_id), settings.CART_TTL)
+        pipe.expire(revision_key(user_id), settings.CART_TTL)
+    pipe.zadd(ACTIVITY_KEY, {str(user_id): time.time()}, xx=not create)
+
+
+def _bump_revision(pipe, user_id):
+    # La primera revisión parte de la hora en ms: si la clave expiró o se
+    # borró, las nuevas revisiones no repiten ETags de un carrito anterior
+    pipe.set(revision_key(user_id), int(time.time() * 1000), nx=True)
+    pipe.incr(revision_key(user_id))
+
+
+def legacy_to_mapping(raw):
+    """Convierte un carrito JSON antiguo en {product_id: quantity}"""
+    cart_data = json.loads(raw)
+    mapping = {}
+    for product_id, cart_item in cart_data.items():
+        quantity = cart_item["quantity"] if isinstance(cart_item, dict) else cart_item
+        quantity = int(quantity)
+        if quantity > 0:
+            mapping[str(product_id)] = quantity
+    return mapping
+
+
+def migrate_legacy_cart(key):
+    """
+    Migra un carrito guardado como string JSON al formato hash.
+    Devuelve las líneas migradas ({} si el JSON era inválido y se descartó)
+    o None si la clave ya no era un string.
+    """
+    def _migrate(pipe):
+        if pipe.type(key) != 'string':
+            return None
+        raw = pipe.get(key)
+        try:
+            mapping = legacy_to_mapping(raw)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            mapping = {}
+        pipe.multi()
+        pipe.delete(key)
+        if mapping:
+            pipe.hset(key, mapping=mapping)
+        return mapping
+
+    return redis_client.transaction(_migrate, key, value_from_callable=True)
+
+
+def _run(key, operation):
+    """Ejecuta la operación y, si la clave es un carrito antiguo, lo migra y reintenta"""
+    try:
+        return operation()
+    except redis.ResponseError as e:
+        if 'WRONGTYPE' not in str(e):
+            raise
+        migrate_legacy_cart(key)
+        return operation()
+
+
+async def _arun(key, operation):
+    """Versión asíncrona de _run; la migración (poco frecuente) corre en un hilo"""
+    try:
+        return await operation()
+    except redis.ResponseError:
+        # El pipeline asíncrono de redis-py pierde el texto WRONGTYPE al
+        # anotar el error: se pregunta el tipo de la clave
+        if await async_redis_client.type(key) != 'string':
+            raise
+        await sync_to_async(migrate_legacy_cart)(key)
+        return await operation()
+
+
+def _product_order(item):
+    product_id = item[0]
+    return (0, int(product_id), '') if product_id.isdigit() else (1, 0, product_id)
+
+
+def _parse_cart(raw_cart):
+    """
+    Líneas válidas del hash, ordenadas por product_id. No se puede usar el
+    orden de HGETALL: Redis solo conserva el de inserción mientras el hash
+    está codificado como listpack (hasta hash-max-listpack-entries campos).
+    """
+    cart_data = {}
+    for product_id, quantity in sorted(raw_cart.items(), key=_product_order):
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            cart_data[product_id] = {"quantity": quantity}
+    return cart_data
+
+
+def _execute(user_id, command, create=True, changed=True):
+    """Ejecuta command(pipe) junto con _touch en un solo round trip y devuelve su resultado"""
+    pipe = redis_client.pipeline(transaction=False)
+    command(pipe)
+    if changed:
+        _bump_revision(pipe, user_id)
+    _touch(pipe, user_id, create)
+    return pipe.execute()[0]
+
+
+def get_cart(user_id):
+    """Devuelve el carrito como {product_id: {"quantity": n}} ordenado por product_id"""
+    key = cart_key(user_id)
+    return _parse_cart(_run(key, lambda: _execute(user_id, lambda pipe: pipe.hgetall(key), create=False, changed=False)))
+
+
+def set_quantity(user_id, product_id, quantity):
+    key = cart_key(user_id)
+    return _run(key, lambda: _execute(user_id, lambda pipe: pipe.hset(key, str(product_id), int(quantity))))
+
+
+def increment_quantity(user_id, product_id, amount=1):
+    """Incrementa la cantidad de un producto y devuelve la nueva cantidad"""
+    key = cart_key(user_id)
+    return _run(key, lambda: _execute(user_id, lambda pipe: pipe.hincrby(key, str(product_id), int(amount))))
+
+
+def remove_item(user_id, product_id):
+    """Elimina un producto del carrito. Devuelve True si existía"""
+    key = cart_key(user_id)
+    return bool(_run(key, lambda: _execute(user_id, lambda pipe: pipe.hdel(key, str(product_id)), create=False)))
+
+
+def apply_batch(user_id, lines):
+    """
+    Aplica las líneas {product_id: quantity} (0 = quitar) en una transacción
+    MULTI y devuelve el carrito resultante, todo en un round trip
+    """
+    key = cart_key(user_id)
+    quantities = {str(product_id): int(quantity) for product_id, quantity in lines.items() if quantity}
+    removed = [str(product_id) for product_id, quantity in lines.items() if not quantity]
+
+    def operation():
+        pipe = redis_client.pipeline(transaction=True)
+        _queue_batch(pipe, user_id, quantities, removed)
+        return pipe.execute()[-1]
+
+    return _parse_cart(_run(key, operation))
+
+
+def _queue_batch(pipe, user_id, quantities, removed):
+    key = cart_key(user_id)
+    if removed:
+        pipe.hdel(key, *removed)
+    if quantities:
+        pipe.hset(key, mapping=quantities)
+    _bump_revision(pipe, user_id)
+    _touch(pipe, user_id, create=bool(quantities))
+    pipe.hgetall(key)
+
+
+def cart_exists(user_id):
+    return bool(redis_client.exists(cart_key(user_id)))
+
+
+def clear_cart(user_id):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.delete(cart_key(user_id), revision_key(user_id))
+    pipe.zrem(ACTIVITY_KEY, str(user_id))
+    pipe.execute()
+
+
+# Versiones asíncronas para las vistas ASGI (mismo formato de datos)
+
+async def _aexecute(user_id, command, create=True, changed=True):
+    pipe = async_redis_client.pipeline(transaction=False)
+    command(pipe)
+    if changed:
+        _bump_revision(pipe, user_id)
+    _touch(pipe, user_id, create)
+    return (await pipe.execute())[0]
+
+
+async def aget_cart(user_id):
+    key = cart_key(user_id)
+    return _parse_cart(await _arun(
+        key, lambda: _aexecute(user_id, lambda pipe: pipe.hgetall(key), create=False, changed=False)
+    ))
+
+
+async def aset_quantity(user_id, product_id, quantity):
+    key = cart_key(user_id)
+    return await _arun(key, lambda: _aexecute(user_id, lambda pipe: pipe.hset(key, str(product_id), int(quantity))))
+
+
+async def aremove_item(user_id, product_id):
+    key = cart_key(user_id)
+    return bool(await _arun(key, lambda: _aexecute(user_id, lambda pipe: pipe.hdel(key, str(product_id)), create=False)))
+
+
+async def aapply_batch(user_id, lines):
+    key = cart_key(user_id)
+    quantities = {str(product_id): int(quantity) for product_id, quantity in lines.items() if quantity}
+    removed = [str(product_id) for product_id, quantity in lines.items() if not quantity]
+
+    async def operation():
+        pipe = async_redis_client.pipeline(transaction=True)
+        _queue_batch(pipe, user_id, quantities, removed)
+        return (await pipe.execute())[-1]
+
+    return _parse_cart(await _arun(key, operation))
+
+
+async def acart_exists(user_id):
+    return bool(await async_redis_client.exists(cart_key(user_id)))
+
+
+async def aclear_cart(user_id):
+    pipe = async_redis_client.pipeline(transaction=False)
+    pipe.delete(cart_key(user_id), revision_key(user_id))
+    pipe.zrem(ACTIVITY_KEY, str(user_id))
+    await pipe.execute()
+
+
+# ETag del carrito
+
+def _etag(revision, catalog_version, stock_version):
+    # El catálogo entra porque nombres y precios de las líneas salen de él,
+    # y el stock por el tramo (stock_status) de cada línea
+    return f'"cart-{revision or 0}-{catalog_version or 0}-{stock_version or 0}"'
+
+
+def cart_etag(user_id):
+    return _etag(*redis_client.mget(revision_key(user_id), CATALOG_VERSION_KEY, STOCK_VERSION_KEY))
+
+
+async def acart_etag(user_id):
+    return _etag(*await async_redis_client.mget(revision_key(user_id), CATALOG_VERSION_KEY, STOCK_VERSION_KEY))
+
+
+# Expiración de carritos abandonados (sweep_abandoned_carts)
+
+def idle_carts(cutoff, limit):
+    """
+    Lee, sin sacarlos de Redis, hasta `limit` carritos sin actividad desde
+    `cutoff` (epoch). Devuelve [(user_id, last_activity, {product_id: quantity})];
+    los carritos que ya expiraron o estaban vacíos vuelven con las líneas vacías.
+    """
+    entries = redis_client.zrangebyscore(ACTIVITY_KEY, '-inf', cutoff, start=0, num=limit, withscores=True)
+    if not entries:
+        return []
+
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id, _ in entries:
+        pipe.hgetall(cart_key(user_id))
+    carts = pipe.execute(raise_on_error=False)
+
+    idle = []
+    for (user_id, last_activity), raw_cart in zip(entries, carts):
+        if isinstance(raw_cart, redis.ResponseError):
+            # Carrito antiguo (JSON en un string)
+            lines = migrate_legacy_cart(cart_key(user_id)) or {}
+        else:
+            lines = {product_id: item["quantity"] for product_id, item in _parse_cart(raw_cart).items()}
+        idle.append((int(user_id), last_activity, lines))
+    return idle
+
+
+def delete_idle_carts(user_ids, cutoff):
+    """
+    Borra de Redis los carritos de `user_ids` que siguen sin actividad desde
+    `cutoff`. Devuelve los ids borrados; los demás volvieron a usarse.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        _claim(keys=[cart_key(user_id), ACTIVITY_KEY, revision_key(user_id)], args=[user_id, cutoff], client=pipe)
+    return [user_id for user_id, deleted in zip(user_ids, pipe.execute()) if deleted]
+
+
+def backfill_expiry(user_ids):
+    """
+    TTL y entrada en carts:activity para carritos sin expiración, creados
+    antes de que existieran (si no, nunca expiran). La última actividad
+    cuenta desde ahora; si el usuario ya estaba en el índice, no se toca.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        if settings.CART_TTL:
+            pipe.expire(cart_key(user_id), settings.CART_TTL)
+        pipe.zadd(ACTIVITY_KEY, {str(user_id): time.time()}, nx=True)
+    pipe.execute()
+
+
+def prune_activity(before):
+    """Quita de carts:activity a los usuarios sin actividad desde `before` (sus carritos ya expiraron)"""
+    return redis_client.zremrangebyscore(ACTIVITY_KEY, '-inf', before)
+
+
+# Carritos vivos y memoria, para /api/metrics/
+
+def cart_stats(sample_size=50):
+    """
+    Devuelve (carritos vivos, bytes estimados). La memoria se estima con
+    MEMORY USAGE sobre una muestra aleatoria; es None si Redis no lo soporta.
+    """
+    since = time.time() - settings.CART_TTL if settings.CART_TTL else '-inf'
+    live = redis_client.zcount(ACTIVITY_KEY, since, '+inf')
+    if not live:
+        return 0, 0
+
+    sample = redis_client.zrandmember(ACTIVITY_KEY, sample_size) or []
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in sample:
+        pipe.memory_usage(cart_key(user_id))
+    try:
+        sizes = [size for size in pipe.execute() if size]
+    except redis.ResponseError:
+        return live, None
+    if not sizes:
+        return live, 0
+    return live, int(sum(sizes) / len(sizes) * live)
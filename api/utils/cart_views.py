@@ -1,9 +1,30 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from api.utils.redis_client import redis_client
+from api.utils import cart_batch, cart_store, http_cache, stock_reservations
+from api.utils.cart_hydration import build_cart_items, hydrate_cart, load_cart_products
 from api.models import Product
-import json
+
+
+def _reserve_line(user_id, product_id, quantity):
+    """
+    Reserva el stock de la línea del carrito. Devuelve una Response de error
+    si el producto no existe o no hay unidades suficientes, o None si reservó.
+    """
+    stock = Product.objects.filter(id=product_id).values_list('stock', flat=True).first()
+    if stock is None:
+        return Response({"error": "Producto no encontrado"}, status=404)
+
+    try:
+        stock_reservations.reserve(user_id, {product_id: quantity}, {product_id: stock})
+    except stock_reservations.StockUnavailable as e:
+        return Response({"error": e.message, "available": e.available}, status=409)
+    return None
+
+
+def _release_cart(user_id):
+    """Libera las reservas de todas las líneas del carrito antes de vaciarlo"""
+    stock_reservations.release(user_id, cart_store.get_cart(user_id).keys())
 
 
 @api_view(['POST'])
@@ -13,90 +34,105 @@ def add_to_cart(request):
     product_id = request.data.get("product_id")
     quantity = int(request.data.get("quantity", 1))
 
+    if quantity <= 0:
+        return Response({"error": "La cantidad debe ser mayor a 0"}, status=400)
+
+    error = _reserve_line(user_id, product_id, quantity)
+    if error:
+        return error
+
+    # Actualizar o insertar el producto (un solo campo del hash cart:{user_id})
+    cart_store.set_quantity(user_id, product_id, quantity)
+
+    return Response({"message": "Producto agregado al carrito"})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_update_cart(request):
+    """
+    Aplica varias operaciones add/update/remove (ver api/utils/cart_batch.py)
+    con una consulta SQL, una reserva de stock y una transacción de Redis,
+    y devuelve el carrito resultante. Todo o nada: si un producto no existe
+    o no alcanza el stock, el carrito no cambia.
+    """
+    user_id = request.user.id
     try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
-        return Response({"error": "Producto no encontrado"}, status=404)
+        lines = cart_batch.parse_operations(request.data)
+    except cart_batch.InvalidBatch as e:
+        return Response(e.as_dict(), status=400)
 
-    # Redis key por usuario
-    cart_key = f"cart:{user_id}"
+    products = Product.objects.with_details().in_bulk(list(lines))
+    missing = cart_batch.missing_product(lines, products)
+    if missing is not None:
+        return Response({"error": "Producto no encontrado", "product_id": missing}, status=404)
 
-    # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
-    else:
-        cart_data = {}
+    reserve_lines, stocks, gone = cart_batch.reservation(lines, products)
+    try:
+        stock_reservations.reserve(user_id, reserve_lines, stocks)
+    except stock_reservations.StockUnavailable as e:
+        return Response(
+            {"error": e.message, "product_id": e.product_id, "available": e.available},
+            status=409
+        )
+    stock_reservations.release(user_id, gone)
 
-    # Actualizar o insertar producto con categoría
-    cart_data[str(product_id)] = {
-        "quantity": quantity,
-        "category": product.category.name  # Usar el nombre de la categoría como string
-    }
+    cart_data = cart_store.apply_batch(user_id, lines)
+    products.update(load_cart_products(cart_batch.other_lines(cart_data, products)))
+    enriched_cart, total_amount = build_cart_items(cart_data, products)
 
-    # Guardar de nuevo en Redis
-    redis_client.set(cart_key, json.dumps(cart_data))
+    return Response({
+        "items": enriched_cart,
+        "total_items": len(enriched_cart),
+        "total_amount": str(total_amount)
+    })
 
-    return Response({"message": "Producto agregado al carrito"})
+
+def _cart_validators(response, etag):
+    # private: el carrito depende del usuario, ningún proxy debe compartirlo
+    return http_cache.set_validators(response, etag, cache_control='private, no-cache', vary=('Authorization',))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def view_cart(request):
     user_id = request.user.id
-    cart_key = f"cart:{user_id}"
-    
+
+    # Si el cliente ya tiene esta revisión del carrito, 304 sin leerlo
+    etag = cart_store.cart_etag(user_id)
+    not_modified = http_cache.not_modified(request, etag)
+    if not_modified is not None:
+        return _cart_validators(not_modified, etag)
+
     # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
-        
+    cart_data = cart_store.get_cart(user_id)
+    if cart_data:
         # Enriquecer datos del carrito con información de productos
-        enriched_cart = []
-        for product_id, cart_item in cart_data.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                enriched_cart.append({
-                    "id": product.id,
-                    "name": product.name,
-                    "image_url": product.image_url,
-                    "price": str(product.price),  # Convertir Decimal a string para JSON
-                    "quantity": cart_item["quantity"],
-                    "category": cart_item["category"],
-                    "type": product.type,
-                    "subtotal": str(product.price * cart_item["quantity"]),
-                    "discount": product.discount 
-                })
-            except Product.DoesNotExist:
-                # Si el producto ya no existe, lo omitimos del carrito
-                continue
+        enriched_cart, total_amount = hydrate_cart(cart_data)
         
-        return Response({
+        response = Response({
             "items": enriched_cart,
             "total_items": len(enriched_cart),
-            "total_amount": str(sum(float(item["subtotal"]) for item in enriched_cart))
+            "total_amount": str(total_amount)
         })
     else:
-        return Response({
+        response = Response({
             "items": [],
             "total_items": 0,
             "total_amount": "0.00"
         })
+    return _cart_validators(response, etag)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def checkout_cart(request):
     user_id = request.user.id
-    cart_key = f"cart:{user_id}"
-
-    # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
 
+    if cart_store.cart_exists(user_id):
         # Aquí iría la lógica para procesar el pago
         # Por simplicidad, solo vaciaremos el carrito
-        redis_client.delete(cart_key)
+        _release_cart(user_id)
+        cart_store.clear_cart(user_id)
         return Response({"message": "Carrito procesado y vaciado"})
     else:
         return Response({"error": "Carrito vacío"}, status=404)
@@ -106,26 +142,17 @@ def checkout_cart(request):
 @permission_classes([IsAuthenticated])
 def remove_from_cart(request):
     user_id = request.user.id
-    cart_key = f"cart:{user_id}"
     product_id = request.data.get('product_id')
     
     if not product_id:
         return Response({"error": "product_id es requerido"}, status=400)
     
-    # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
-        
-        # Remover el producto si existe
-        if str(product_id) in cart_data:
-            del cart_data[str(product_id)]
-            
-            # Guardar el carrito actualizado
-            redis_client.set(cart_key, json.dumps(cart_data))
-            return Response({"message": "Producto removido del carrito"})
-        else:
-            return Response({"error": "Producto no encontrado en el carrito"}, status=404)
+    # Remover el producto si existe
+    if cart_store.remove_item(user_id, product_id):
+        stock_reservations.release(user_id, [product_id])
+        return Response({"message": "Producto removido del carrito"})
+    elif cart_store.cart_exists(user_id):
+        return Response({"error": "Producto no encontrado en el carrito"}, status=404)
     else:
         return Response({"error": "Carrito vacío"}, status=404)
 
@@ -143,28 +170,12 @@ def update_cart_quantity(request):
     if quantity <= 0:
         return Response({"error": "La cantidad debe ser mayor a 0"}, status=400)
 
-    try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
-        return Response({"error": "Producto no encontrado"}, status=404)
-
-    cart_key = f"cart:{user_id}"
-    
-    # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
-    else:
-        cart_data = {}
+    error = _reserve_line(user_id, product_id, quantity)
+    if error:
+        return error
 
     # Actualizar cantidad del producto
-    cart_data[str(product_id)] = {
-        "quantity": quantity,
-        "category": product.category.name  # Usar el nombre de la categoría como string
-    }
-
-    # Guardar de nuevo en Redis
-    redis_client.set(cart_key, json.dumps(cart_data))
+    cart_store.set_quantity(user_id, product_id, quantity)
 
     return Response({"message": "Cantidad actualizada en el carrito"})
 
@@ -173,10 +184,10 @@ def update_cart_quantity(request):
 @permission_classes([IsAuthenticated])
 def clear_cart(request):
     user_id = request.user.id
-    cart_key = f"cart:{user_id}"
     
-    # Eliminar todo el carrito
-    redis_client.delete(cart_key)
+    # Liberar las reservas y eliminar todo el carrito
+    _release_cart(user_id)
+    cart_store.clear_cart(user_id)
     
     return Response({"message": "Carrito vaciado completamente"})
 
@@ -188,61 +199,21 @@ def view_cart_detailed(request):
     Versión detallada del carrito que incluye información específica de bicicletas
     """
     user_id = request.user.id
-    cart_key = f"cart:{user_id}"
     
     # Leer el carrito actual
-    current_cart = redis_client.get(cart_key)
-    if current_cart:
-        cart_data = json.loads(current_cart)
-        
+    cart_data = cart_store.get_cart(user_id)
+    if cart_data:
         # Enriquecer datos del carrito con información completa de productos
-        enriched_cart = []
-        for product_id, cart_item in cart_data.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                
-                # Datos básicos del producto
-                product_info = {
-                    "id": product.id,
-                    "name": product.name,
-                    "image_url": product.image_url,
-                    "price": str(product.price),
-                    "description": product.description,
-                    "quantity": cart_item["quantity"],
-                    "category": cart_item["category"],
-                    "type": product.type,
-                    "stock": product.stock,
-                    "subtotal": str(product.price * cart_item["quantity"])
-                }
-                
-                # Si es una bicicleta, agregar información específica
-                if product.type == 'bicycle':
-                    try:
-                        bicycle = product.bicycle
-                        product_info["bicycle_details"] = {
-                            "bike_type": bicycle.bike_type,
-                            "wheel_size": bicycle.wheel_size,
-                            "color": bicycle.color,
-                            "material": bicycle.material,
-                            "weight": str(bicycle.weight) if bicycle.weight else None
-                        }
-                    except:
-                        product_info["bicycle_details"] = None
-                
-                enriched_cart.append(product_info)
-                
-            except Product.DoesNotExist:
-                # Si el producto ya no existe, lo omitimos del carrito
-                continue
+        enriched_cart, total_amount = hydrate_cart(cart_data, detailed=True)
         
         return Response({
             "items": enriched_cart,
             "total_items": len(enriched_cart),
-            "total_amount": str(sum(float(item["subtotal"]) for item in enriched_cart))
+            "total_amount": str(total_amount)
         })
     else:
         return Response({
             "items": [],
             "total_items": 0,
             "total_amount": "0.00"
-        })
\ No newline at end of file
+        })
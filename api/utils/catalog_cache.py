@@ -0,0 +1,258 @@
+"""
+Cache de lectura para los endpoints del catálogo.
+
+Las respuestas se guardan en Redis ya renderizadas (bytes JSON) bajo una
+clave que incluye la versión del catálogo. Las señales de Product, Category
+y Bicycle incrementan esa versión, así que nunca hace falta borrar claves:
+las entradas viejas simplemente dejan de leerse y expiran por TTL.
+
+Las entradas que dependen del stock incluyen además una versión de stock,
+que el checkout incrementa sin invalidar el resto del catálogo.
+
+Cada versión guarda también cuándo cambió (``…:ts``). Con eso las respuestas
+llevan ETag (derivado de la clave del cache), Last-Modified y Cache-Control
+público, de modo que un CDN puede servirlas y los clientes revalidan con 304.
+Las versiones parten de la hora en ms y no de 0: si Redis se vacía, las
+nuevas versiones (y sus ETags) no repiten las de antes.
+
+Junto a cada respuesta se guarda su variante comprimida para el
+Accept-Encoding del cliente (``{clave}:gzip`` / ``{clave}:br``, ver
+api/utils/compression.py): se comprime una vez por versión y no en cada
+request.
+"""
+import hashlib
+import time
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+
+from api.utils import compression, http_cache
+from api.utils.redis_client import (
+    async_redis_binary_client,
+    async_redis_client,
+    redis_binary_client,
+    redis_client,
+)
+
+CATALOG_VERSION_KEY = "catalog:version"
+STOCK_VERSION_KEY = "catalog:stock_version"
+_STAMP_KEYS = (
+    CATALOG_VERSION_KEY, STOCK_VERSION_KEY,
+    f"{CATALOG_VERSION_KEY}:ts", f"{STOCK_VERSION_KEY}:ts",
+)
+
+
+def _seed_version(pipe, key):
+    # La primera versión parte de la hora en ms (como las revisiones del
+    # carrito): tras vaciar Redis no se repiten versiones ni ETags anteriores
+    pipe.set(key, int(time.time() * 1000), nx=True)
+    pipe.set(f"{key}:ts", int(time.time()), nx=True)
+
+
+def _seed_versions(pipe):
+    _seed_version(pipe, CATALOG_VERSION_KEY)
+    _seed_version(pipe, STOCK_VERSION_KEY)
+    pipe.mget(*_STAMP_KEYS)
+
+
+def get_versions():
+    """Devuelve (versión del catálogo, versión del stock) en una sola llamada"""
+    return get_version_stamps()[0]
+
+
+def _parse_stamps(values):
+    catalog_version, stock_version, catalog_ts, stock_ts = values
+    return (int(catalog_version or 0), int(stock_version or 0)), (int(catalog_ts or 0), int(stock_ts or 0))
+
+
+def get_version_stamps():
+    """Devuelve ((versión del catálogo, del stock), (epoch de cada cambio)) en una llamada"""
+    values = redis_client.mget(*_STAMP_KEYS)
+    if None in values[:2]:
+        pipe = redis_client.pipeline(transaction=False)
+        _seed_versions(pipe)
+        values = pipe.execute()[-1]
+    return _parse_stamps(values)
+
+
+async def aget_version_stamps():
+    values = await async_redis_client.mget(*_STAMP_KEYS)
+    if None in values[:2]:
+        pipe = async_redis_client.pipeline(transaction=False)
+        _seed_versions(pipe)
+        values = (await pipe.execute())[-1]
+    return _parse_stamps(values)
+
+
+def response_cache_key(cache_name, versions, request, depends_on_stock=True):
+    catalog_version, stock_version = versions
+    if not depends_on_stock:
+        stock_version = '-'
+    # Esquema y host entran en la clave: las páginas por cursor llevan los
+    # enlaces next/previous absolutos
+    variant = f"{request.scheme}://{request.get_host()}?{request.META.get('QUERY_STRING', '')}"
+    variant_hash = hashlib.md5(variant.encode()).hexdigest()
+    return f"catalog:resp:{cache_name}:{catalog_version}:{stock_version}:{variant_hash}"
+
+
+def http_validators(cache_key, timestamps, depends_on_stock=True):
+    """(ETag, Last-Modified) de una respuesta del catálogo"""
+    etag = '"%s"' % hashlib.md5(cache_key.encode()).hexdigest()
+    catalog_ts, stock_ts = timestamps
+    last_modified = max(catalog_ts, stock_ts) if depends_on_stock else catalog_ts
+    return etag, last_modified or None
+
+
+def set_http_cache_headers(response, etag, last_modified):
+    return http_cache.set_validators(
+        response, etag, last_modified,
+        cache_control=f'public, max-age={settings.CATALOG_HTTP_MAX_AGE}',
+        vary=('Accept',),
+    )
+
+
+def _cache_keys(key, encoding):
+    """Clave de la respuesta y, si el cliente acepta compresión, la de su variante"""
+    return [key, f"{key}:{encoding}"] if encoding else [key]
+
+
+def _compressed(body, encoding):
+    """Variante comprimida de una respuesta del catálogo, o None si no conviene"""
+    if encoding is None or not compression.is_compressible('application/json', len(body)):
+        return None
+    compressed = compression.compress(body, encoding)
+    return compressed if len(compressed) < len(body) else None
+
+
+async def aget_cached_response(request, cache_name, depends_on_stock=True):
+    """
+    Para las vistas asíncronas: un 304 si el cliente ya tiene la versión
+    actual, el cuerpo JSON cacheado con sus headers, o None si hay que
+    generarlo
+    """
+    try:
+        versions, timestamps = await aget_version_stamps()
+    except redis.RedisError:
+        return None
+    key = response_cache_key(cache_name, versions, request, depends_on_stock)
+    etag, last_modified = http_validators(key, timestamps, depends_on_stock)
+
+    response = http_cache.not_modified(request, etag, last_modified)
+    if response is None:
+        if not settings.CATALOG_CACHE_ENABLED:
+            return None
+        encoding = compression.accepted_encoding(request)
+        try:
+            body, *encoded = await async_redis_binary_client.mget(_cache_keys(key, encoding))
+        except redis.RedisError:
+            return None
+        if body is None:
+            return None
+        encoded = encoded[0] if encoded else None
+        if encoded is None:
+            encoded = _compressed(body, encoding)
+            if encoded is not None:
+                try:
+                    await async_redis_binary_client.set(f"{key}:{encoding}", encoded, ex=settings.CATALOG_CACHE_TTL)
+                except redis.RedisError:
+                    pass
+        # Headers de validación primero: set_encoded_content debilita el ETag
+        response = set_http_cache_headers(HttpResponse(body, content_type='application/json'), etag, last_modified)
+        if encoded is not None:
+            compression.set_encoded_content(response, encoded, encoding)
+        return response
+    return set_http_cache_headers(response, etag, last_modified)
+
+
+def _incr(key):
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        _seed_version(pipe, key)
+        pipe.incr(key)
+        pipe.set(f"{key}:ts", int(time.time()))
+        pipe.execute()
+    except redis.RedisError:
+        # Sin Redis no hay cache que invalidar; las entradas expiran por TTL
+        pass
+
+
+def bump_catalog_version():
+    """Invalida todas las respuestas cacheadas del catálogo tras el commit"""
+    transaction.on_commit(lambda: _incr(CATALOG_VERSION_KEY))
+
+
+def bump_stock_version():
+    """Invalida solo las respuestas que dependen del stock tras el commit"""
+    transaction.on_commit(lambda: _incr(STOCK_VERSION_KEY))
+
+
+class CatalogCacheMixin:
+    """
+    Mixin para vistas GET del catálogo. Responde 304 si el If-None-Match /
+    If-Modified-Since del cliente corresponde a la versión actual; si no,
+    sirve la respuesta desde Redis sin pasar por el serializer, y en un fallo
+    la genera, la guarda y la devuelve.
+    """
+    cache_name = None
+    cache_depends_on_stock = True
+
+    def get_cache_key(self, request, versions):
+        return response_cache_key(self.cache_name, versions, request, self.cache_depends_on_stock)
+
+    def get(self, request, *args, **kwargs):
+        # Solo se cachea JSON; el navegador de DRF sigue el camino normal
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+
+        try:
+            versions, timestamps = get_version_stamps()
+        except redis.RedisError:
+            return super().get(request, *args, **kwargs)
+        cache_key = self.get_cache_key(request, versions)
+        etag, last_modified = http_validators(cache_key, timestamps, self.cache_depends_on_stock)
+
+        response = http_cache.not_modified(request, etag, last_modified)
+        if response is not None:
+            return set_http_cache_headers(response, etag, last_modified)
+
+        if not settings.CATALOG_CACHE_ENABLED:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            return set_http_cache_headers(response, etag, last_modified)
+
+        encoding = compression.accepted_encoding(request)
+        try:
+            body, *encoded = redis_binary_client.mget(_cache_keys(cache_key, encoding))
+        except redis.RedisError:
+            return super().get(request, *args, **kwargs)
+        encoded = encoded[0] if encoded else None
+
+        to_store = {}
+        if body is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = request.accepted_renderer.render(response.data)
+            to_store[cache_key] = body
+        if encoded is None:
+            encoded = _compressed(body, encoding)
+            if encoded is not None:
+                to_store[f"{cache_key}:{encoding}"] = encoded
+        if to_store:
+            try:
+                pipe = redis_binary_client.pipeline(transaction=False)
+                for key, value in to_store.items():
+                    pipe.set(key, value, ex=settings.CATALOG_CACHE_TTL)
+                pipe.execute()
+            except redis.RedisError:
+                pass
+
+        response = set_http_cache_headers(
+            HttpResponse(body, content_type='application/json'), etag, last_modified
+        )
+        if encoded is not None:
+            compression.set_encoded_content(response, encoded, encoding)
+        return response
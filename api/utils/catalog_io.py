@@ -0,0 +1,162 @@
+"""
+Formato de intercambio del catálogo para import_catalog / export_catalog.
+
+Cada registro es un producto con su categoría y, si es bicicleta, sus
+detalles, en una sola fila:
+
+- NDJSON: un objeto JSON por línea, con ``bicycle`` anidado o null.
+- CSV: columnas planas; las de bicicleta quedan vacías en los accesorios.
+
+Lectura y escritura son iterativas (una fila a la vez), así que la memoria
+no depende del tamaño del archivo.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+
+from api.models import Product
+
+FORMATS = ('ndjson', 'csv')
+
+PRODUCT_FIELDS = ['id', 'name', 'price', 'description', 'category_id', 'category', 'image_url', 'stock', 'type', 'discount']
+BICYCLE_FIELDS = ['bike_type', 'wheel_size', 'color', 'material', 'weight']
+CSV_COLUMNS = PRODUCT_FIELDS + BICYCLE_FIELDS
+
+PRODUCT_TYPES = {value for value, _ in Product.PRODUCT_TYPES}
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def detect_format(path, explicit=None):
+    if explicit:
+        return explicit
+    if path.endswith('.csv'):
+        return 'csv'
+    return 'ndjson'
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def _iter_ndjson(stream):
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            raise InvalidRecord(f"Línea {line_number}: JSON inválido ({e})")
+
+
+def _iter_csv(stream):
+    reader = csv.DictReader(stream)
+    # La línea 1 es el encabezado
+    for line_number, row in enumerate(reader, start=2):
+        bicycle = {field: row.get(field) for field in BICYCLE_FIELDS}
+        record = {field: row.get(field) for field in PRODUCT_FIELDS}
+        record['bicycle'] = bicycle if any(bicycle.values()) else None
+        yield line_number, record
+
+
+def _parse(line_number, record):
+    """Valida y convierte un registro crudo a tipos de Python"""
+    try:
+        product = {
+            'id': int(record['id']),
+            'name': record['name'],
+            'price': Decimal(str(record['price'])),
+            'description': record.get('description') or '',
+            'category_id': int(record['category_id']),
+            'category': record['category'],
+            'image_url': record.get('image_url') or '',
+            'stock': int(record.get('stock') or 0),
+            'type': record['type'],
+            'discount': int(record.get('discount') or 0),
+        }
+        bicycle = record.get('bicycle')
+        if bicycle:
+            bicycle = {
+                'bike_type': bicycle['bike_type'],
+                'wheel_size': int(bicycle['wheel_size']),
+                'color': bicycle['color'],
+                'material': bicycle['material'],
+                'weight': Decimal(str(bicycle['weight'])),
+            }
+    except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+        raise InvalidRecord(f"Línea {line_number}: registro inválido ({e!r})")
+
+    if not product['name'] or not product['category']:
+        raise InvalidRecord(f"Línea {line_number}: el nombre y la categoría son obligatorios")
+    if product['type'] not in PRODUCT_TYPES:
+        raise InvalidRecord(f"Línea {line_number}: tipo de producto inválido: {product['type']}")
+    product['bicycle'] = bicycle
+    return product
+
+
+def read_records(stream, fmt):
+    """Itera los productos del archivo ya validados"""
+    rows = _iter_csv(stream) if fmt == 'csv' else _iter_ndjson(stream)
+    for line_number, record in rows:
+        yield _parse(line_number, record)
+
+
+# ---------------------------------------------------------------------------
+# Escritura
+# ---------------------------------------------------------------------------
+
+def export_rows(chunk_size):
+    """
+    Filas del catálogo como dicts planos, leídas con un cursor del servidor
+    (iterator) y sin instanciar modelos.
+    """
+    queryset = (
+        Product.objects
+        .order_by('pk')
+        .values(
+            'id', 'name', 'price', 'description', 'category_id', 'image_url', 'stock', 'type', 'discount',
+            category_name=F('category__name'),
+            **{f'bicycle_{field}': F(f'bicycle__{field}') for field in BICYCLE_FIELDS}
+        )
+    )
+    for row in queryset.iterator(chunk_size=chunk_size):
+        row['category'] = row.pop('category_name')
+        bicycle = {field: row.pop(f'bicycle_{field}') for field in BICYCLE_FIELDS}
+        row['bicycle'] = bicycle if bicycle['bike_type'] is not None else None
+        yield row
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Tipo no serializable: {type(value).__name__}")
+
+
+class NDJSONWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, ensure_ascii=False, default=_json_default) + '\n')
+
+
+class CSVWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=CSV_COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        flat = {field: row[field] for field in PRODUCT_FIELDS}
+        bicycle = row['bicycle'] or {}
+        for field in BICYCLE_FIELDS:
+            flat[field] = bicycle.get(field, '')
+        self.writer.writerow(flat)
+
+
+def writer_for(stream, fmt):
+    return CSVWriter(stream) if fmt == 'csv' else NDJSONWriter(stream)
@@ -0,0 +1,208 @@
+"""
+Motor de checkout: procesa todos los items de una compra con operaciones
+por conjuntos y filas bloqueadas, para evitar sobreventa bajo concurrencia.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from rest_framework import status
+
+from api.models import Bicycle, BicycleSale, Product, UserProfile
+from api.utils import leaderboard, pricing, product_snapshots, stock_reservations, user_cache
+from api.utils.catalog_cache import bump_stock_version
+
+logger = logging.getLogger(__name__)
+
+# Se lee una sola vez al importar: con False (producción) el bucle de
+# validación no evalúa ni siquiera logger.isEnabledFor() por item
+DEBUG_LOGGING = settings.CHECKOUT_DEBUG_LOGGING
+
+
+class CheckoutError(Exception):
+    """Error de negocio del checkout, con el status HTTP a devolver"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def merge_items(items):
+    """
+    Agrupa los items recibidos por producto, sumando cantidades repetidas.
+    Los items sin product_id o sin quantity se ignoran.
+    Devuelve un dict {product_id: quantity} en el orden recibido.
+    """
+    lines = {}
+    for item in items:
+        product_id = item.get('product_id')
+        quantity = item.get('quantity')
+
+        if not product_id or not quantity:
+            continue
+
+        try:
+            product_id = int(product_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise CheckoutError(f"Item inválido: {item}")
+
+        if quantity <= 0:
+            raise CheckoutError(f"Cantidad inválida para el producto {product_id}: {quantity}")
+
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def _lock_products(product_ids):
+    """Bloquea todas las filas en una consulta, siempre en el mismo orden"""
+    locked = (
+        Product.objects
+        .select_for_update()
+        .filter(pk__in=product_ids)
+        .order_by('pk')
+    )
+    return {product.pk: product for product in locked}
+
+
+def _validate_lines(lines, products):
+    for product_id, quantity in lines.items():
+        product = products.get(product_id)
+        if product is None:
+            raise CheckoutError(
+                f"Producto con ID {product_id} no encontrado",
+                status.HTTP_404_NOT_FOUND
+            )
+        if product.type not in ('bicycle', 'accessory'):
+            raise CheckoutError(f"Tipo de producto no soportado: {product.type}")
+        if product.stock < quantity:
+            raise CheckoutError(
+                f"Stock insuficiente para {product.name}. "
+                f"Disponible: {product.stock}, Solicitado: {quantity}"
+            )
+        if DEBUG_LOGGING:
+            logger.debug(
+                "Item validado - producto=%s tipo=%s cantidad=%s stock=%s",
+                product_id, product.type, quantity, product.stock
+            )
+
+    bicycle_ids = [pid for pid, product in products.items() if product.type == 'bicycle']
+    existing = set(Bicycle.objects.filter(pk__in=bicycle_ids).values_list('pk', flat=True))
+    for product_id in bicycle_ids:
+        if product_id not in existing:
+            raise CheckoutError(
+                f"Bicicleta asociada al producto {product_id} no encontrada",
+                status.HTTP_404_NOT_FOUND
+            )
+    return bicycle_ids
+
+
+def _decrement_stock(lines):
+    """Descuenta el stock de todos los productos en un único UPDATE"""
+    updated = Product.objects.filter(pk__in=lines.keys()).update(
+        stock=Case(
+            *[When(pk=pid, then=F('stock') - quantity) for pid, quantity in lines.items()],
+            default=F('stock'),
+            output_field=IntegerField(),
+        )
+    )
+    if updated != len(lines):
+        raise CheckoutError(
+            "No se pudo actualizar el stock de todos los productos",
+            status.HTTP_409_CONFLICT
+        )
+
+
+def _debit_credit(user, total_amount):
+    """Descuenta el crédito del usuario sobre la fila bloqueada"""
+    profile = UserProfile.objects.select_for_update().get(user=user)
+    if profile.credit < total_amount:
+        raise CheckoutError(
+            f"Crédito insuficiente. Disponible: ${profile.credit}, Requerido: ${total_amount}"
+        )
+    UserProfile.objects.filter(pk=profile.pk).update(credit=F('credit') - total_amount)
+    # update() no dispara señales: invalidar el perfil cacheado a mano
+    user_cache.invalidate_profile_on_commit(user.pk)
+    return profile.credit - total_amount
+
+
+def process_checkout(user, items, expected_total=None):
+    """
+    Ejecuta la compra completa dentro de una transacción:
+
+    0. Descarta en Redis, sin tocar la base de datos, las compras que no
+       caben en el stock disponible más lo que el usuario tiene reservado.
+    1. Bloquea todas las filas de producto con un solo SELECT ... FOR UPDATE.
+    2. Valida existencia, tipo y stock sobre los valores bloqueados y calcula
+       el total con los precios y descuentos de esas mismas filas. Si no
+       coincide con ``expected_total`` (el precio cambió) la compra se rechaza.
+    3. Descuenta el stock con un UPDATE condicional (CASE + F()).
+    4. Crea todas las ventas de bicicletas con un solo bulk_create.
+    5. Descuenta el crédito del usuario de forma atómica.
+    6. Tras el commit, suma las ventas al ranking de bicicletas, invalida
+       las respuestas cacheadas que dependen del stock y convierte las
+       reservas del carrito en ventas (en ese orden).
+
+    Lanza CheckoutError si la compra no puede realizarse; en ese caso la
+    transacción se revierte completa.
+    """
+    lines = merge_items(items)
+    if not lines:
+        raise CheckoutError("No se encontraron items válidos para procesar")
+
+    try:
+        stock_reservations.check_available(user.pk, lines)
+    except stock_reservations.StockUnavailable as e:
+        raise CheckoutError(e.message)
+
+    with transaction.atomic():
+        products = _lock_products(list(lines))
+        bicycle_ids = _validate_lines(lines, products)
+
+        _, total_amount = pricing.cart_total(
+            lines, {pk: (product.price, product.discount) for pk, product in products.items()}
+        )
+        if expected_total is not None and total_amount != Decimal(expected_total):
+            raise CheckoutError(
+                f"Los precios cambiaron. Nuevo total: ${total_amount}",
+                status.HTTP_409_CONFLICT
+            )
+
+        _decrement_stock(lines)
+
+        created_sales = BicycleSale.objects.bulk_create([
+            BicycleSale(bicycle_id=product_id, user=user, quantity=lines[product_id])
+            for product_id in bicycle_ids
+        ])
+
+        remaining_credit = _debit_credit(user, total_amount)
+
+        # Actualizar el ranking de más vendidas solo si la compra se confirma,
+        # antes de invalidar las respuestas: el top de bicicletas que se
+        # regenere con la versión nueva ya incluye esta venta
+        transaction.on_commit(lambda: leaderboard.record_sales(created_sales))
+
+        # El stock cambió: invalidar solo las respuestas que dependen de él
+        bump_stock_version()
+        # y las instantáneas del carrito cuyo tramo de stock cambia
+        product_snapshots.forget_on_commit([
+            product_id for product_id, quantity in lines.items()
+            if product_snapshots.stock_bucket(products[product_id].stock)
+            != product_snapshots.stock_bucket(products[product_id].stock - quantity)
+        ])
+        stock_reservations.consume_on_commit(user.pk, lines)
+
+    if DEBUG_LOGGING:
+        logger.debug(
+            "Checkout confirmado - usuario=%s productos=%s ventas=%s",
+            user.pk, len(lines), len(created_sales)
+        )
+
+    return {
+        "bicycle_sales_created": len(created_sales),
+        "total_amount": total_amount,
+        "remaining_credit": remaining_credit,
+    }
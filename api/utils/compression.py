@@ -0,0 +1,103 @@
+"""
+Compresión de respuestas (gzip y, si está instalado el paquete brotli, br).
+
+Solo se comprimen respuestas no streaming cuyo Content-Type está en
+RESPONSE_COMPRESSION_TYPES y cuyo cuerpo mide al menos
+RESPONSE_COMPRESSION_MIN_SIZE bytes. RESPONSE_COMPRESSION_LEVEL (1-9) es
+el nivel de gzip y la calidad de brotli.
+
+La compresión es determinista (gzip sin fecha), así que el catálogo guarda
+la variante comprimida junto a su respuesta cacheada (``{clave}:gzip``,
+``{clave}:br``) y la paga una sola vez por versión del catálogo. A
+diferencia de GZipMiddleware no se agregan bytes aleatorios contra BREACH:
+las respuestas que llevan tokens JWT (login y token/refresh) nunca se
+comprimen, y el resto no incluye secretos (tokens CSRF, sesiones).
+"""
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Vistas cuyas respuestas llevan tokens (BREACH): nunca se comprimen
+EXCLUDED_URL_NAMES = frozenset({'login', 'debug-token', 'token_obtain_pair', 'token_refresh'})
+
+
+def _accepted_codings(header):
+    """Codificaciones de Accept-Encoding con q > 0"""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def accepted_encoding(request):
+    """'br', 'gzip' o None según Accept-Encoding y lo disponible"""
+    if not settings.RESPONSE_COMPRESSION_ENABLED:
+        return None
+    accepted = _accepted_codings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def is_compressible(content_type, size):
+    if not settings.RESPONSE_COMPRESSION_ENABLED or size < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+        return False
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    return media_type in settings.RESPONSE_COMPRESSION_TYPES
+
+
+def compress(body, encoding):
+    level = settings.RESPONSE_COMPRESSION_LEVEL
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def set_encoded_content(response, body, encoding):
+    """Pone el cuerpo comprimido y los headers correspondientes"""
+    response.content = body
+    response['Content-Encoding'] = encoding
+    response['Content-Length'] = str(len(body))
+    patch_vary_headers(response, ('Accept-Encoding',))
+    # Otra representación del mismo recurso: el ETag pasa a ser débil
+    # (If-None-Match compara en modo débil, así que los 304 siguen funcionando)
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    return response
+
+
+def compress_response(request, response):
+    """Comprime la respuesta si corresponde (usado por CompressionMiddleware)"""
+    if response.streaming or response.has_header('Content-Encoding'):
+        return response
+    if getattr(request.resolver_match, 'url_name', None) in EXCLUDED_URL_NAMES:
+        return response
+    if not is_compressible(response.get('Content-Type', ''), len(response.content)):
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = accepted_encoding(request)
+    if encoding is None:
+        return response
+    body = compress(response.content, encoding)
+    if len(body) >= len(response.content):
+        return response
+    return set_encoded_content(response, body, encoding)
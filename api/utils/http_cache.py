@@ -0,0 +1,24 @@
+"""
+GET condicional (ETag / Last-Modified → 304) para el catálogo y el carrito.
+
+Los ETags se arman con las versiones que ya están en Redis (versión del
+catálogo y del stock, revisión del carrito), así que la comparación con
+If-None-Match se resuelve antes de cualquier consulta o serialización.
+"""
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def not_modified(request, etag, last_modified=None):
+    """HttpResponseNotModified si el cliente ya tiene esta versión, o None"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None, cache_control='no-cache', vary=()):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
@@ -0,0 +1,166 @@
+"""
+Idempotencia para endpoints que modifican datos (header ``Idempotency-Key``).
+
+La primera petición con una clave toma un candado en Redis
+(``idem:{user_id}:{hash de la clave}``), ejecuta la vista y guarda la
+respuesta serializada. Los reintentos con la misma clave reciben esa
+respuesta sin volver a ejecutar la vista; los duplicados que llegan
+mientras la primera sigue en curso esperan su resultado en lugar de
+competir con ella. Reutilizar una clave con otro cuerpo devuelve 422.
+"""
+import functools
+import hashlib
+import json
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+PENDING = 'pending'
+DONE = 'done'
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def storage_key(user_id, idempotency_key):
+    digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+    return f"idem:{user_id}:{digest}"
+
+
+def request_fingerprint(data):
+    """Hash del cuerpo de la petición, independiente del orden de las claves"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _acquire(key, fingerprint):
+    """
+    Toma el candado de la clave y devuelve None, o devuelve la respuesta
+    guardada de una ejecución anterior. Si otra petición con la misma clave
+    está en curso, espera hasta IDEMPOTENCY_WAIT_TIMEOUT a que termine.
+    """
+    pending = json.dumps({"state": PENDING, "fingerprint": fingerprint})
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+    while True:
+        if redis_client.set(key, pending, nx=True, ex=settings.IDEMPOTENCY_LOCK_TTL):
+            return None
+
+        raw = redis_client.get(key)
+        if raw is None:
+            # La ejecución anterior falló y liberó la clave: reintentar el candado
+            continue
+
+        stored = json.loads(raw)
+        if stored["fingerprint"] != fingerprint:
+            raise IdempotencyConflict(
+                "La clave de idempotencia ya se usó con otro contenido",
+                status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if stored["state"] == DONE:
+            return stored
+
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict(
+                "Hay una petición con la misma clave de idempotencia en curso",
+                status.HTTP_409_CONFLICT
+            )
+        time.sleep(POLL_INTERVAL)
+
+
+def _store(key, fingerprint, response):
+    body = JSONRenderer().render(response.data).decode()
+    redis_client.set(key, json.dumps({
+        "state": DONE,
+        "fingerprint": fingerprint,
+        "status": response.status_code,
+        "body": body,
+    }), ex=settings.IDEMPOTENCY_TTL)
+
+
+def _release(key):
+    try:
+        redis_client.delete(key)
+    except redis.RedisError:
+        pass
+
+
+def _replay(stored):
+    response = HttpResponse(stored["body"], status=stored["status"], content_type='application/json')
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Decorador para métodos de APIView. Sin header Idempotency-Key la vista se
+    ejecuta como siempre. Solo se guardan las respuestas con status < 500:
+    tras un error del servidor la clave se libera para que el cliente reintente.
+    Si no se puede guardar una respuesta exitosa, la clave no se libera.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if not idempotency_key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} no puede superar {MAX_KEY_LENGTH} caracteres"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        key = storage_key(request.user.pk, idempotency_key)
+        fingerprint = request_fingerprint(request.data)
+        try:
+            stored = _acquire(key, fingerprint)
+        except IdempotencyConflict as e:
+            return Response({"error": e.message}, status=e.status_code)
+        except redis.RedisError:
+            logger.warning("Redis no disponible; %s se procesa sin idempotencia", HEADER)
+            return view_method(self, request, *args, **kwargs)
+
+        if stored is not None:
+            return _replay(stored)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            _release(key)
+            raise
+
+        if response.status_code >= 500:
+            _release(key)
+            return response
+
+        try:
+            _store(key, fingerprint, response)
+        except redis.RedisError:
+            logger.warning("No se pudo guardar la respuesta idempotente de %s", key)
+            # Con status < 400 la vista ya aplicó sus efectos (compra
+            # confirmada): liberar la clave dejaría que un reintento los
+            # repita. Queda en curso (409) hasta que venza IDEMPOTENCY_LOCK_TTL
+            if response.status_code >= 400:
+                _release(key)
+        return response
+
+    return wrapper
@@ -0,0 +1,264 @@
+"""
+Ranking de bicicletas más vendidas mantenido en sorted sets de Redis.
+
+- ``leaderboard:bicycles:all``: unidades vendidas desde siempre.
+- ``leaderboard:bicycles:day:YYYYMMDD``: unidades vendidas por día (UTC).
+- ``leaderboard:bicycles:window:N:YYYYMMDD``: las ventanas de 7 y 30 días
+  calendario (UTC) que terminan ese día. La primera lectura del día la arma
+  con ZUNIONSTORE de los rankings diarios; desde ahí cada venta la
+  incrementa, así que el ZUNIONSTORE corre una vez por ventana y por día.
+
+El checkout incrementa los rankings con ZINCRBY al hacer commit, así que
+leer el top N es O(log n + N) en lugar de un GROUP BY sobre toda la tabla
+de ventas. El comando ``rebuild_leaderboard`` los reconstruye desde
+BicycleSale; mientras no se hayan construido, las lecturas usan SQL con la
+misma definición de ventana (días calendario UTC, no 24 h móviles).
+
+Mientras una reconstrucción está en curso (``leaderboard:bicycles:rebuilding``)
+cada venta registrada se anota además en un diario. Al publicar los rankings
+nuevos se vuelven a aplicar las ventas del diario que no estaban en la foto
+de BicycleSale, así que ninguna venta concurrente se pierde ni se cuenta dos
+veces.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import redis
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from api.models import BicycleSale
+from api.utils.redis_client import redis_client
+
+ALL_TIME_KEY = "leaderboard:bicycles:all"
+BUILT_KEY = "leaderboard:bicycles:built"
+REBUILDING_KEY = "leaderboard:bicycles:rebuilding"
+JOURNAL_KEY = "leaderboard:bicycles:journal"
+# Si una reconstrucción se interrumpe, el diario deja de llenarse solo
+REBUILD_TIMEOUT = 600
+WINDOWS = (7, 30)
+# La clave de la ventana lleva la fecha: solo se usa ese día
+WINDOW_KEY_TTL = 25 * 60 * 60
+# Los rankings diarios se conservan un poco más que la ventana más larga
+DAY_KEY_TTL = (max(WINDOWS) + 2) * 24 * 60 * 60
+
+
+def day_key(day):
+    return f"leaderboard:bicycles:day:{day:%Y%m%d}"
+
+
+def _window_key(days, today):
+    return f"leaderboard:bicycles:window:{days}:{today:%Y%m%d}"
+
+
+def window_days(window, today):
+    """Días (UTC) que forman la ventana: hoy y los window - 1 anteriores"""
+    return [today - timedelta(days=offset) for offset in range(window)]
+
+
+# KEYS: ranking total, marca de reconstrucción, diario, las ventanas de hoy
+# (en el orden de WINDOWS) y el ranking del día de cada venta; ARGV: TTL de
+# los días, TTL del diario, cantidad de ventanas y (id, bicicleta, unidades,
+# ventanas) por venta, donde ventanas es una cadena de 0/1 por ventana.
+# Las ventanas que ya existen se incrementan en la misma operación atómica
+# que los días, así que una venta nunca queda contada dos veces ni falta.
+_LUA_RECORD = """
+local rebuilding = redis.call('EXISTS', KEYS[2]) == 1
+local windows = tonumber(ARGV[3])
+local first_day = 4 + windows
+for i = first_day, #KEYS do
+    local base = 4 + (i - first_day) * 4
+    local sale_id, bicycle_id, quantity = ARGV[base], ARGV[base + 1], ARGV[base + 2]
+    local in_windows = ARGV[base + 3]
+    redis.call('ZINCRBY', KEYS[1], quantity, bicycle_id)
+    redis.call('ZINCRBY', KEYS[i], quantity, bicycle_id)
+    redis.call('EXPIRE', KEYS[i], ARGV[1])
+    for w = 1, windows do
+        if string.sub(in_windows, w, w) == '1' and redis.call('EXISTS', KEYS[3 + w]) == 1 then
+            redis.call('ZINCRBY', KEYS[3 + w], quantity, bicycle_id)
+        end
+    end
+    if rebuilding then
+        redis.call('RPUSH', KEYS[3], sale_id .. '|' .. bicycle_id .. '|' .. quantity .. '|' .. KEYS[i])
+    end
+end
+if rebuilding then
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+end
+"""
+
+# KEYS: la ventana y los rankings diarios que la forman; ARGV: TTL y N
+_LUA_WINDOW_TOP = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('ZUNIONSTORE', KEYS[1], #KEYS - 1, unpack(KEYS, 2))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+"""
+
+_record = redis_client.register_script(_LUA_RECORD)
+_window_top = redis_client.register_script(_LUA_WINDOW_TOP)
+
+
+def record_sales(sales):
+    """Suma al ranking las ventas de bicicletas (BicycleSale ya guardadas) en un solo pipeline"""
+    if not sales:
+        return
+    today = timezone.now().date()
+    args = [DAY_KEY_TTL, REBUILD_TIMEOUT, len(WINDOWS)]
+    for sale in sales:
+        sale_day = sale.sale_date.date()
+        in_windows = ''.join('1' if sale_day > today - timedelta(days=days) else '0' for days in WINDOWS)
+        args += [sale.pk, sale.bicycle_id, sale.quantity, in_windows]
+    try:
+        _record(
+            keys=[
+                ALL_TIME_KEY, REBUILDING_KEY, JOURNAL_KEY,
+                *[_window_key(days, today) for days in WINDOWS],
+                *[day_key(sale.sale_date.date()) for sale in sales],
+            ],
+            args=args,
+        )
+    except redis.RedisError:
+        # El ranking se puede reconstruir con rebuild_leaderboard
+        pass
+
+
+def _top_from_redis(limit, window):
+    if window is None:
+        return [int(member) for member in redis_client.zrevrange(ALL_TIME_KEY, 0, limit - 1)]
+    today = timezone.now().date()
+    members = _window_top(
+        keys=[_window_key(window, today), *[day_key(day) for day in window_days(window, today)]],
+        args=[WINDOW_KEY_TTL, limit],
+    )
+    return [int(member) for member in members]
+
+
+def top_sales_queryset(limit, window=None):
+    """Consulta SQL del ranking (respaldo cuando Redis no tiene los rankings)"""
+    sales = BicycleSale.objects.all()
+    if window is not None:
+        # Mismas ventanas que Redis: días calendario UTC completos
+        first_day = window_days(window, timezone.now().date())[-1]
+        since = datetime.combine(first_day, datetime.min.time(), tzinfo=dt_timezone.utc)
+        sales = sales.filter(sale_date__gte=since)
+    return (
+        sales
+        .values('bicycle')  # agrupar por ID de bicicleta
+        .annotate(total_sold=Sum('quantity'))  # sumar las ventas
+        .order_by('-total_sold')[:limit]
+    )
+
+
+def _top_from_database(limit, window):
+    return [item['bicycle'] for item in top_sales_queryset(limit, window)]
+
+
+def top_bicycle_ids(limit=3, window=None):
+    """
+    IDs de las bicicletas más vendidas, de mayor a menor.
+    window: None (desde siempre) o uno de WINDOWS en días.
+    """
+    try:
+        if redis_client.exists(BUILT_KEY):
+            return _top_from_redis(limit, window)
+    except redis.RedisError:
+        pass
+    return _top_from_database(limit, window)
+
+
+def _replay(entries, included):
+    """Aplica las ventas del diario que no estaban en la foto de la reconstrucción"""
+    pipe = redis_client.pipeline(transaction=False)
+    for entry in entries:
+        sale_id, bicycle_id, quantity, key = entry.split('|', 3)
+        if int(sale_id) in included:
+            continue
+        pipe.zincrby(ALL_TIME_KEY, int(quantity), bicycle_id)
+        pipe.zincrby(key, int(quantity), bicycle_id)
+        pipe.expire(key, DAY_KEY_TTL)
+    # Una ventana armada entre la publicación y este punto no incluye el diario
+    today = timezone.now().date()
+    pipe.delete(*[_window_key(days, today) for days in WINDOWS])
+    pipe.execute()
+
+
+def rebuild():
+    """
+    Reconstruye todos los rankings desde BicycleSale. Los datos se escriben
+    en claves temporales y se publican con RENAME dentro de un MULTI, así que
+    los lectores nunca ven un ranking a medio construir.
+
+    Las ventas que se registran durante la reconstrucción quedan en el diario
+    y se aplican al publicar si no estaban en la foto. La foto y la consulta
+    de qué ventas del diario incluía se hacen en la misma transacción
+    REPEATABLE READ (en PostgreSQL), así que ven los mismos datos.
+    Devuelve el número de bicicletas en el ranking total.
+    """
+    today = timezone.now().date()
+    since = window_days(max(WINDOWS), today)[-1]
+
+    pipe = redis_client.pipeline()
+    pipe.delete(JOURNAL_KEY)
+    pipe.set(REBUILDING_KEY, 1, ex=REBUILD_TIMEOUT)
+    pipe.execute()
+
+    # Dentro de otra transacción (tests) no se puede cambiar el aislamiento
+    repeatable_read = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if repeatable_read:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+        totals = (
+            BicycleSale.objects
+            .values_list('bicycle')
+            .annotate(total_sold=Sum('quantity'))
+        )
+        daily = {}
+        recent = (
+            BicycleSale.objects
+            .filter(sale_date__date__gte=since)
+            .values_list('sale_date__date', 'bicycle')
+            .annotate(total_sold=Sum('quantity'))
+        )
+        mapping = {bicycle_id: total_sold for bicycle_id, total_sold in totals}
+        for sale_day, bicycle_id, total_sold in recent:
+            daily.setdefault(sale_day, {})[bicycle_id] = total_sold
+
+        pipe = redis_client.pipeline()
+        renames = []
+        if mapping:
+            pipe.zadd(f"{ALL_TIME_KEY}:rebuild", mapping)
+            renames.append((f"{ALL_TIME_KEY}:rebuild", ALL_TIME_KEY))
+        for sale_day, day_mapping in daily.items():
+            key = day_key(sale_day)
+            pipe.zadd(f"{key}:rebuild", day_mapping)
+            renames.append((f"{key}:rebuild", key))
+        pipe.execute()
+
+        # Publicar y cerrar el diario en el mismo MULTI: las ventas posteriores
+        # ya se suman directamente a los rankings nuevos
+        pipe = redis_client.pipeline()
+        pipe.delete(ALL_TIME_KEY, *[day_key(since + timedelta(days=d)) for d in range(max(WINDOWS))])
+        for temp_key, key in renames:
+            pipe.rename(temp_key, key)
+            if key != ALL_TIME_KEY:
+                pipe.expire(key, DAY_KEY_TTL)
+        for key in redis_client.scan_iter(match="leaderboard:bicycles:window:*"):
+            pipe.delete(key)
+        pipe.set(BUILT_KEY, 1)
+        pipe.lrange(JOURNAL_KEY, 0, -1)
+        pipe.delete(JOURNAL_KEY, REBUILDING_KEY)
+        entries = pipe.execute()[-2]
+
+        included = set()
+        if entries:
+            included = set(BicycleSale.objects.filter(
+                pk__in=[int(entry.split('|', 1)[0]) for entry in entries]
+            ).values_list('pk', flat=True))
+
+    if entries:
+        _replay(entries, included)
+    return len(mapping)
@@ -0,0 +1,56 @@
+"""
+Contexto de logging por request: id de correlación y muestreo de DEBUG.
+
+RequestMetricsMiddleware fija el id de correlación (header X-Request-ID o uno
+generado) en un ContextVar; RequestIdFilter lo copia a cada registro como
+%(request_id)s. SampledDebugFilter deja pasar solo una fracción de los
+mensajes DEBUG para poder activarlos en producción sin inundar los logs.
+"""
+import contextvars
+import logging
+import random
+import re
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+_request_id = contextvars.ContextVar('request_id', default='-')
+
+# Ids recibidos del cliente: solo caracteres seguros y longitud acotada
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def start_request_id(incoming=None):
+    """Fija el id de correlación del request y devuelve (id, token)"""
+    if not incoming or not _VALID_REQUEST_ID.match(incoming):
+        incoming = uuid.uuid4().hex
+    return incoming, _request_id.set(incoming)
+
+
+def end_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Agrega request_id a todos los registros (o '-' fuera de un request)"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SampledDebugFilter(logging.Filter):
+    """Deja pasar todos los registros INFO o superiores y una fracción de los DEBUG"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
@@ -0,0 +1,194 @@
+"""
+Métricas por request: tiempo total, consultas SQL, comandos Redis y tamaño
+de la respuesta, agregadas por ruta en histogramas en memoria del proceso.
+
+RequestMetricsMiddleware (api/middleware.py) abre un RequestStats por
+request; los clientes Redis instrumentados de redis_client.py y
+count_queries, instalado en cada conexión a la base de datos, suman sus
+comandos y consultas al RequestStats activo a través de un ContextVar. El
+ContextVar viaja con sync_to_async, así que también se cuentan las consultas
+que las vistas async hacen en el hilo (y la conexión) del executor. render_prometheus()
+expone lo agregado en formato de texto de Prometheus.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('db_queries', 'db_time', 'redis_commands', 'redis_time')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_commands = 0
+        self.redis_time = 0.0
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current_stats.set(stats)
+
+
+def end_request(token):
+    _current_stats.reset(token)
+
+
+def record_redis(commands, elapsed):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.redis_commands += commands
+        stats.redis_time += elapsed
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper que cuenta y cronometra el SQL del request activo"""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def install_db_wrapper(connection):
+    """Instala count_queries en una conexión (una sola vez)"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimación por interpolación lineal dentro del bucket, como histogram_quantile()"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_commands = 0
+        self.redis_time = 0.0
+
+
+_lock = threading.Lock()
+_routes = {}
+
+
+def observe(route, method, status_code, duration, size, stats):
+    key = (route, method, str(status_code)[0] + 'xx')
+    with _lock:
+        metrics = _routes.get(key)
+        if metrics is None:
+            metrics = _routes[key] = RouteMetrics()
+        metrics.duration.observe(duration)
+        if size is not None:
+            metrics.size.observe(size)
+        metrics.db_queries += stats.db_queries
+        metrics.db_time += stats.db_time
+        metrics.redis_commands += stats.redis_commands
+        metrics.redis_time += stats.redis_time
+
+
+def _labels(route, method, status_class, **extra):
+    pairs = [('route', route), ('method', method), ('status', status_class), *extra.items()]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+def _histogram_lines(name, histogram, labels):
+    lines = []
+    cumulative = 0
+    for upper, bucket_count in zip(histogram.buckets, histogram.counts):
+        cumulative += bucket_count
+        lines.append(f'{name}_bucket{labels(le=upper)} {cumulative}')
+    lines.append(f'{name}_bucket{labels(le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{labels()} {histogram.total}')
+    lines.append(f'{name}_count{labels()} {histogram.count}')
+    return lines
+
+
+def render_prometheus():
+    """Texto en formato de exposición de Prometheus con las métricas de este proceso"""
+    with _lock:
+        snapshot = list(_routes.items())
+
+    sections = {
+        'api_request_duration_seconds': ('histogram', 'Tiempo total del request'),
+        'api_request_duration_quantile_seconds': ('gauge', 'p50/p95/p99 estimados del tiempo del request'),
+        'api_response_size_bytes': ('histogram', 'Tamaño del cuerpo de la respuesta'),
+        'api_db_queries_total': ('counter', 'Consultas SQL ejecutadas'),
+        'api_db_time_seconds_total': ('counter', 'Tiempo en consultas SQL'),
+        'api_redis_commands_total': ('counter', 'Comandos Redis enviados'),
+        'api_redis_time_seconds_total': ('counter', 'Tiempo en llamadas a Redis'),
+    }
+    output = {name: [] for name in sections}
+
+    for (route, method, status_class), metrics in snapshot:
+        def labels(**extra):
+            return _labels(route, method, status_class, **extra)
+
+        output['api_request_duration_seconds'] += _histogram_lines(
+            'api_request_duration_seconds', metrics.duration, labels)
+        for q in QUANTILES:
+            output['api_request_duration_quantile_seconds'].append(
+                f'api_request_duration_quantile_seconds{labels(quantile=q)} {metrics.duration.quantile(q)}')
+        output['api_response_size_bytes'] += _histogram_lines(
+            'api_response_size_bytes', metrics.size, labels)
+        output['api_db_queries_total'].append(f'api_db_queries_total{labels()} {metrics.db_queries}')
+        output['api_db_time_seconds_total'].append(f'api_db_time_seconds_total{labels()} {metrics.db_time}')
+        output['api_redis_commands_total'].append(f'api_redis_commands_total{labels()} {metrics.redis_commands}')
+        output['api_redis_time_seconds_total'].append(f'api_redis_time_seconds_total{labels()} {metrics.redis_time}')
+
+    lines = []
+    for name, (metric_type, help_text) in sections.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        lines.extend(output[name])
+    return '\n'.join(lines) + '\n'
+
+
+def render_gauges(gauges):
+    """Gauges sueltos {nombre: (ayuda, valor)} en formato Prometheus; omite los valores None"""
+    lines = []
+    for name, (help_text, value) in gauges.items():
+        if value is None:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n' if lines else ''
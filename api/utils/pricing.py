@@ -0,0 +1,101 @@
+"""
+Motor de precios: subtotales y total exacto (Decimal) de un carrito a partir
+de los precios y descuentos de la base de datos, nunca del cliente.
+
+El precio unitario con descuento se redondea a centavos (ROUND_HALF_UP) y
+luego se multiplica por la cantidad, así que el total siempre es la suma de
+los subtotales que se muestran.
+
+``load_prices`` lee los precios desde una instantánea en Redis
+(``pricing:snapshot:{versión del catálogo}``) y solo consulta la base de
+datos, en una única consulta, por los productos que faltan. Como la clave
+incluye la versión del catálogo, cualquier cambio de un producto hace que
+se use una instantánea nueva.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+import redis
+from django.conf import settings
+
+from api.models import Product
+from api.utils.catalog_cache import get_versions
+from api.utils.redis_client import redis_client
+
+CENTS = Decimal('0.01')
+
+
+def unit_price(price, discount):
+    """Precio unitario con el descuento (porcentaje entero) aplicado"""
+    discount = min(max(int(discount or 0), 0), 100)
+    price = Decimal(price)
+    return (price - price * discount / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def line_subtotal(price, discount, quantity):
+    return unit_price(price, discount) * int(quantity)
+
+
+def cart_total(lines, prices):
+    """
+    Calcula {product_id: subtotal} y el total de las líneas {product_id: quantity}
+    con los precios {product_id: (price, discount)}. Las líneas sin precio
+    (productos que ya no existen) se omiten.
+    """
+    subtotals = {}
+    total = Decimal('0.00')
+    for product_id, quantity in lines.items():
+        if product_id not in prices:
+            continue
+        price, discount = prices[product_id]
+        subtotal = line_subtotal(price, discount, quantity)
+        subtotals[product_id] = subtotal
+        total += subtotal
+    return subtotals, total
+
+
+def snapshot_key(catalog_version):
+    return f"pricing:snapshot:{catalog_version}"
+
+
+def load_prices(product_ids):
+    """Devuelve {product_id: (price, discount)} con a lo sumo una consulta SQL"""
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return {}
+
+    # La versión se lee antes que la base de datos: si un producto cambia en
+    # medio, lo que se guarde queda bajo una versión que ya no se usará
+    try:
+        key = snapshot_key(get_versions()[0])
+        cached = redis_client.hmget(key, product_ids)
+    except redis.RedisError:
+        key, cached = None, [None] * len(product_ids)
+
+    prices = {}
+    missing = []
+    for product_id, raw in zip(product_ids, cached):
+        if raw is None:
+            missing.append(product_id)
+        else:
+            price, discount = raw.split(':')
+            prices[product_id] = (Decimal(price), int(discount))
+
+    if missing:
+        fresh = {
+            pk: (price, discount)
+            for pk, price, discount in Product.objects.filter(pk__in=missing)
+            .values_list('pk', 'price', 'discount')
+        }
+        prices.update(fresh)
+        if key and fresh:
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.hset(key, mapping={
+                    pk: f"{price}:{discount}" for pk, (price, discount) in fresh.items()
+                })
+                pipe.expire(key, settings.CATALOG_CACHE_TTL)
+                pipe.execute()
+            except redis.RedisError:
+                pass
+
+    return prices
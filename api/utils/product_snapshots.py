@@ -0,0 +1,199 @@
+"""
+Instantáneas compactas de producto para pintar las líneas del carrito sin SQL.
+
+Todas viven en un solo hash de Redis (``product:snapshots``, campo =
+product_id, valor = JSON con nombre, precio, descuento, imagen, tipo,
+categoría y un tramo de stock), así que un carrito completo se lee con un
+único HMGET. Los productos que faltan se cargan en una sola consulta y se
+guardan para la siguiente vez.
+
+Las señales de Product y Category reescriben las instantáneas al confirmar
+la transacción y el checkout descarta las de los productos vendidos. Los
+cambios que no pasan por señales (QuerySet.update, bulk_create) quedan
+cubiertos por la antigüedad máxima: cada entrada lleva su marca de tiempo y
+las que superan PRODUCT_SNAPSHOT_MAX_AGE se vuelven a leer de PostgreSQL.
+"""
+import json
+import time
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from api.models import Product
+from api.utils.redis_client import async_redis_client, redis_client
+
+SNAPSHOTS_KEY = "product:snapshots"
+
+# Con el tramo en lugar del stock exacto, vender una unidad casi nunca
+# cambia lo que muestra el carrito
+LOW_STOCK_THRESHOLD = 5
+
+
+def stock_bucket(stock):
+    if stock <= 0:
+        return 'out'
+    if stock <= LOW_STOCK_THRESHOLD:
+        return 'low'
+    return 'in'
+
+
+def _snapshot(name, price, discount, image_url, product_type, category, stock):
+    return {
+        'name': name,
+        'price': str(price),
+        'discount': discount,
+        'image_url': image_url,
+        'type': product_type,
+        'category': category,
+        'stock_bucket': stock_bucket(stock),
+    }
+
+
+def snapshot_from_product(product):
+    """Instantánea de un Product ya cargado (con su categoría)"""
+    return _snapshot(
+        product.name, product.price, product.discount, product.image_url,
+        product.type, product.category.name, product.stock,
+    )
+
+
+def _query(product_ids):
+    rows = (
+        Product.objects.filter(pk__in=product_ids)
+        .values_list('pk', 'name', 'price', 'discount', 'image_url', 'type', 'category__name', 'stock')
+    )
+    return {pk: _snapshot(*values) for pk, *values in rows}
+
+
+def _decode(product_ids, cached):
+    """Separa lo leído de Redis en (vigentes, ids a recargar)"""
+    oldest = time.time() - settings.PRODUCT_SNAPSHOT_MAX_AGE
+    snapshots = {}
+    missing = []
+    for product_id, raw in zip(product_ids, cached):
+        if raw is None:
+            missing.append(product_id)
+            continue
+        snapshot = json.loads(raw)
+        if snapshot.pop('ts') < oldest:
+            missing.append(product_id)
+        else:
+            snapshots[product_id] = snapshot
+    return snapshots, missing
+
+
+def _encode(snapshots):
+    now = time.time()
+    return {pk: json.dumps({**snapshot, 'ts': now}) for pk, snapshot in snapshots.items()}
+
+
+def get_snapshots(product_ids):
+    """Devuelve {product_id: instantánea}; omite los productos que no existen"""
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return {}
+    try:
+        cached = redis_client.hmget(SNAPSHOTS_KEY, product_ids)
+    except redis.RedisError:
+        return _query(product_ids)
+
+    snapshots, missing = _decode(product_ids, cached)
+    if missing:
+        fresh = _query(missing)
+        snapshots.update(fresh)
+        if fresh:
+            try:
+                redis_client.hset(SNAPSHOTS_KEY, mapping=_encode(fresh))
+            except redis.RedisError:
+                pass
+    return snapshots
+
+
+async def aget_snapshots(product_ids):
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return {}
+    try:
+        cached = await async_redis_client.hmget(SNAPSHOTS_KEY, product_ids)
+    except redis.RedisError:
+        cached = [None] * len(product_ids)
+
+    snapshots, missing = _decode(product_ids, cached)
+    if missing:
+        rows = (
+            Product.objects.filter(pk__in=missing)
+            .values_list('pk', 'name', 'price', 'discount', 'image_url', 'type', 'category__name', 'stock')
+        )
+        fresh = {pk: _snapshot(*values) async for pk, *values in rows}
+        snapshots.update(fresh)
+        if fresh:
+            try:
+                await async_redis_client.hset(SNAPSHOTS_KEY, mapping=_encode(fresh))
+            except redis.RedisError:
+                pass
+    return snapshots
+
+
+def snapshot_price(snapshot):
+    return Decimal(snapshot['price']), snapshot['discount']
+
+
+# ---------------------------------------------------------------------------
+# Invalidación (señales, checkout, importaciones)
+# ---------------------------------------------------------------------------
+
+def refresh(product_ids):
+    """Reescribe las instantáneas desde la base de datos y borra las de productos inexistentes"""
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return
+    fresh = _query(product_ids)
+    gone = [product_id for product_id in product_ids if product_id not in fresh]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        if fresh:
+            pipe.hset(SNAPSHOTS_KEY, mapping=_encode(fresh))
+        if gone:
+            pipe.hdel(SNAPSHOTS_KEY, *gone)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def refresh_on_commit(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: refresh(product_ids))
+
+
+def refresh_category_on_commit(category_id):
+    def _refresh_now():
+        product_ids = list(Product.objects.filter(category_id=category_id).values_list('pk', flat=True))
+        # Por lotes para no armar un HSET gigante en categorías grandes
+        for start in range(0, len(product_ids), 1000):
+            refresh(product_ids[start:start + 1000])
+
+    transaction.on_commit(_refresh_now)
+
+
+def forget_on_commit(product_ids):
+    """Descarta instantáneas (se recargan en la próxima lectura)"""
+    product_ids = [int(product_id) for product_id in product_ids]
+
+    def _forget_now():
+        try:
+            redis_client.hdel(SNAPSHOTS_KEY, *product_ids)
+        except redis.RedisError:
+            pass
+
+    if product_ids:
+        transaction.on_commit(_forget_now)
+
+
+def forget_all():
+    """Tras cargas masivas sin señales; UNLINK libera el hash en segundo plano"""
+    try:
+        redis_client.unlink(SNAPSHOTS_KEY)
+    except redis.RedisError:
+        pass
@@ -1,11 +1,141 @@
 # en cualquier archivo reutilizable como utils/redis_client.py
 
+import asyncio
+import threading
+import time
+
 import redis
+import redis.asyncio
+import redis.asyncio.client
+import redis.client
+from redis.commands.core import AsyncScript
 from django.conf import settings
 
-redis_client = redis.StrictRedis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    db=settings.REDIS_DB,
-    decode_responses=True  # para que los datos estén en string
-)
+from api.utils.metrics import record_redis
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            record_redis(commands, time.perf_counter() - start)
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """Cliente Redis que suma comandos y tiempo a las métricas del request activo"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            record_redis(1, time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+class InstrumentedAsyncPipeline(redis.asyncio.client.Pipeline):
+    async def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record_redis(commands, time.perf_counter() - start)
+
+
+class InstrumentedAsyncRedis(redis.asyncio.StrictRedis):
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis(1, time.perf_counter() - start)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedAsyncPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def _build_pool(pool_class=redis.BlockingConnectionPool, **kwargs):
+    """
+    Pool bloqueante: si se agotan las conexiones, el hilo espera hasta
+    REDIS_POOL_TIMEOUT en lugar de abrir conexiones sin límite.
+    """
+    return pool_class(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        **kwargs
+    )
+
+
+redis_pool = _build_pool(decode_responses=True)  # para que los datos estén en string
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+
+# Cliente sin decodificación para guardar cuerpos de respuesta ya renderizados (bytes)
+redis_binary_pool = _build_pool()
+redis_binary_client = InstrumentedRedis(connection_pool=redis_binary_pool)
+
+class PerLoopAsyncRedis:
+    """
+    Cliente redis.asyncio con un pool por event loop. Las conexiones de
+    asyncio quedan atadas al loop en que se abrieron: bajo ASGI el worker
+    tiene un solo loop, pero bajo WSGI (runserver, tests) Django ejecuta
+    cada vista asíncrona en un loop nuevo que se cierra al terminar.
+    """
+
+    def __init__(self, **pool_kwargs):
+        self._pool_kwargs = pool_kwargs
+        self._local = threading.local()
+
+    def _client(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None  # fuera de un loop (al importar): solo para el encoder
+        current = getattr(self._local, 'current', None)
+        if current is None or current[0] is not loop:
+            client = InstrumentedAsyncRedis(
+                connection_pool=_build_pool(redis.asyncio.BlockingConnectionPool, **self._pool_kwargs)
+            )
+            current = self._local.current = (loop, client)
+        return current[1]
+
+    def register_script(self, script):
+        # El script resuelve el cliente del loop activo en cada llamada
+        return AsyncScript(self, script)
+
+    def __getattr__(self, name):
+        return getattr(self._client(), name)
+
+
+# Clientes asíncronos para las vistas de api/async_views.py
+async_redis_client = PerLoopAsyncRedis(decode_responses=True)
+async_redis_binary_client = PerLoopAsyncRedis()
+
+
+def pool_stats(pool):
+    """Conexiones creadas, libres y en uso de un pool de Redis"""
+    # BlockingConnectionPool no expone contadores públicos: se leen sus
+    # estructuras internas (lista de conexiones creadas y cola de libres)
+    created = len(pool._connections)
+    available = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "available": available,
+        "in_use": created - available,
+    }
@@ -0,0 +1,311 @@
+"""
+Reservas blandas de stock en Redis para los carritos.
+
+Por producto se mantienen tres claves:
+
+- ``stock:avail:{product_id}``: unidades disponibles para reservar, es decir,
+  el stock de PostgreSQL menos las reservas activas.
+- ``stock:holds:{product_id}``: hash {user_id: unidades reservadas}.
+- ``stock:expiry:{product_id}``: sorted set {user_id: vencimiento (epoch)}.
+
+Agregar o actualizar un producto del carrito reserva las unidades con un
+script Lua atómico (todo o nada si son varios productos). Las reservas
+vencen a los CART_RESERVATION_TTL segundos y cada script devuelve las
+unidades vencidas al contador antes de operar, así que no hace falta un
+proceso aparte para liberarlas.
+
+PostgreSQL sigue siendo la fuente de verdad: el checkout valida el stock
+sobre filas bloqueadas, y al confirmar la compra convierte las reservas
+en ventas (consume). ``reconcile_stock_reservations`` recalcula los
+contadores desde la base de datos.
+"""
+import time
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from api.utils.redis_client import async_redis_client, redis_client
+
+# Devuelve a stock:avail las unidades de reservas vencidas y las borra
+_LUA_RECLAIM = """
+local function reclaim(avail, holds, expiry, now)
+    local expired = redis.call('ZRANGEBYSCORE', expiry, '-inf', now)
+    local has_avail = redis.call('EXISTS', avail) == 1
+    for _, member in ipairs(expired) do
+        local held = tonumber(redis.call('HGET', holds, member) or '0')
+        if held > 0 and has_avail then
+            redis.call('INCRBY', avail, held)
+        end
+        redis.call('HDEL', holds, member)
+    end
+    if #expired > 0 then
+        redis.call('ZREMRANGEBYSCORE', expiry, '-inf', now)
+    end
+    return #expired
+end
+
+local function active_holds(holds)
+    local total = 0
+    for _, value in ipairs(redis.call('HVALS', holds)) do
+        total = total + tonumber(value)
+    end
+    return total
+end
+"""
+
+# KEYS: (avail, holds, expiry) por producto
+# ARGV: user_id, now, expires_at, y (cantidad, stock en BD) por producto;
+# cantidad 0 libera la reserva del producto
+# Devuelve {0, 0} si reservó todo, o {i, disponible} con el primer producto sin stock
+_LUA_RESERVE = _LUA_RECLAIM + """
+local user, now, expires_at = ARGV[1], tonumber(ARGV[2]), ARGV[3]
+local count = #KEYS / 3
+local held = {}
+
+for i = 1, count do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    local quantity, db_stock = tonumber(ARGV[2 + 2 * i]), tonumber(ARGV[3 + 2 * i])
+    reclaim(avail, holds, expiry, now)
+    if redis.call('EXISTS', avail) == 0 then
+        redis.call('SET', avail, db_stock - active_holds(holds))
+    end
+    held[i] = tonumber(redis.call('HGET', holds, user) or '0')
+    local available = tonumber(redis.call('GET', avail)) + held[i]
+    if quantity > available then
+        return {i, available}
+    end
+end
+
+for i = 1, count do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    local quantity = tonumber(ARGV[2 + 2 * i])
+    redis.call('DECRBY', avail, quantity - held[i])
+    if quantity > 0 then
+        redis.call('HSET', holds, user, quantity)
+        redis.call('ZADD', expiry, expires_at, user)
+    else
+        redis.call('HDEL', holds, user)
+        redis.call('ZREM', expiry, user)
+    end
+end
+return {0, 0}
+"""
+
+# KEYS: (avail, holds, expiry) por producto; ARGV: user_id, now, y cantidad por producto
+# Igual que la primera pasada de RESERVE pero sin modificar nada
+_LUA_CHECK = _LUA_RECLAIM + """
+local user, now = ARGV[1], tonumber(ARGV[2])
+for i = 1, #KEYS / 3 do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    reclaim(avail, holds, expiry, now)
+    local current = redis.call('GET', avail)
+    if current then
+        local available = tonumber(current) + tonumber(redis.call('HGET', holds, user) or '0')
+        if tonumber(ARGV[2 + i]) > available then
+            return {i, available}
+        end
+    end
+end
+return {0, 0}
+"""
+
+# KEYS: (avail, holds, expiry) por producto; ARGV: user_id, now
+_LUA_RELEASE = _LUA_RECLAIM + """
+local user, now = ARGV[1], tonumber(ARGV[2])
+for i = 1, #KEYS / 3 do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    reclaim(avail, holds, expiry, now)
+    local held = tonumber(redis.call('HGET', holds, user) or '0')
+    if held > 0 and redis.call('EXISTS', avail) == 1 then
+        redis.call('INCRBY', avail, held)
+    end
+    redis.call('HDEL', holds, user)
+    redis.call('ZREM', expiry, user)
+end
+return 0
+"""
+
+# KEYS: (avail, holds, expiry) por producto; ARGV: user_id, now, y unidades compradas
+# Las unidades reservadas pasan a vendidas; solo la diferencia con la reserva
+# mueve el contador, así que el orden entre checkouts concurrentes no importa
+_LUA_CONSUME = _LUA_RECLAIM + """
+local user, now = ARGV[1], tonumber(ARGV[2])
+for i = 1, #KEYS / 3 do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    reclaim(avail, holds, expiry, now)
+    local held = tonumber(redis.call('HGET', holds, user) or '0')
+    if redis.call('EXISTS', avail) == 1 then
+        redis.call('DECRBY', avail, tonumber(ARGV[2 + i]) - held)
+    end
+    redis.call('HDEL', holds, user)
+    redis.call('ZREM', expiry, user)
+end
+return 0
+"""
+
+# KEYS: (avail, holds, expiry) por producto; ARGV: now, y stock en BD por producto
+# Devuelve cuántas reservas vencidas se liberaron
+_LUA_SYNC = _LUA_RECLAIM + """
+local now = tonumber(ARGV[1])
+local reclaimed = 0
+for i = 1, #KEYS / 3 do
+    local avail, holds, expiry = KEYS[3 * i - 2], KEYS[3 * i - 1], KEYS[3 * i]
+    reclaimed = reclaimed + reclaim(avail, holds, expiry, now)
+    redis.call('SET', avail, tonumber(ARGV[1 + i]) - active_holds(holds))
+end
+return reclaimed
+"""
+
+_reserve = redis_client.register_script(_LUA_RESERVE)
+_check = redis_client.register_script(_LUA_CHECK)
+_release = redis_client.register_script(_LUA_RELEASE)
+_consume = redis_client.register_script(_LUA_CONSUME)
+_sync = redis_client.register_script(_LUA_SYNC)
+
+_areserve = async_redis_client.register_script(_LUA_RESERVE)
+_arelease = async_redis_client.register_script(_LUA_RELEASE)
+
+
+class StockUnavailable(Exception):
+    """No hay unidades suficientes para reservar un producto"""
+
+    def __init__(self, product_id, available, requested):
+        super().__init__(f"Stock insuficiente para el producto {product_id}")
+        self.product_id = product_id
+        self.available = max(int(available), 0)
+        self.requested = requested
+
+    @property
+    def message(self):
+        return f"Stock insuficiente. Disponible: {self.available}, Solicitado: {self.requested}"
+
+
+def product_keys(product_id):
+    product_id = int(product_id)
+    return [
+        f"stock:avail:{product_id}",
+        f"stock:holds:{product_id}",
+        f"stock:expiry:{product_id}",
+    ]
+
+
+def _keys(product_ids):
+    keys = []
+    for product_id in product_ids:
+        keys.extend(product_keys(product_id))
+    return keys
+
+
+def _reserve_args(user_id, lines, stocks):
+    now = time.time()
+    args = [user_id, now, now + settings.CART_RESERVATION_TTL]
+    for product_id, quantity in lines.items():
+        args.extend([int(quantity), int(stocks[product_id])])
+    return args
+
+
+def _raise_if_unavailable(result, lines):
+    index, available = (int(value) for value in result)
+    if index:
+        product_id = list(lines)[index - 1]
+        raise StockUnavailable(product_id, available, lines[product_id])
+
+
+def reserve(user_id, lines, stocks):
+    """
+    Reserva para el usuario las cantidades {product_id: quantity} (absolutas,
+    reemplazan la reserva anterior; 0 la libera). ``stocks`` trae el stock de PostgreSQL de
+    cada producto para inicializar su contador si aún no existe.
+    Lanza StockUnavailable sin reservar nada si algún producto no alcanza.
+    """
+    if not settings.STOCK_RESERVATIONS_ENABLED or not lines:
+        return
+    result = _reserve(keys=_keys(lines), args=_reserve_args(user_id, lines, stocks))
+    _raise_if_unavailable(result, lines)
+
+
+async def areserve(user_id, lines, stocks):
+    if not settings.STOCK_RESERVATIONS_ENABLED or not lines:
+        return
+    result = await _areserve(keys=_keys(lines), args=_reserve_args(user_id, lines, stocks))
+    _raise_if_unavailable(result, lines)
+
+
+def check_available(user_id, lines):
+    """
+    Verifica en Redis, sin tocar la base de datos, que las cantidades pedidas
+    caben en lo disponible más lo que el usuario ya reservó. Los productos sin
+    contador se dejan pasar (los valida el checkout). Lanza StockUnavailable.
+    """
+    if not settings.STOCK_RESERVATIONS_ENABLED or not lines:
+        return
+    try:
+        result = _check(keys=_keys(lines), args=[user_id, time.time(), *lines.values()])
+    except redis.RedisError:
+        return
+    _raise_if_unavailable(result, lines)
+
+
+def release(user_id, product_ids):
+    """Libera las reservas del usuario sobre los productos indicados"""
+    product_ids = list(product_ids)
+    if not settings.STOCK_RESERVATIONS_ENABLED or not product_ids:
+        return
+    _release(keys=_keys(product_ids), args=[user_id, time.time()])
+
+
+async def arelease(user_id, product_ids):
+    product_ids = list(product_ids)
+    if not settings.STOCK_RESERVATIONS_ENABLED or not product_ids:
+        return
+    await _arelease(keys=_keys(product_ids), args=[user_id, time.time()])
+
+
+def _consume_now(user_id, lines):
+    try:
+        _consume(keys=_keys(lines), args=[user_id, time.time(), *lines.values()])
+    except redis.RedisError:
+        # Los contadores se corrigen con reconcile_stock_reservations
+        pass
+
+
+def consume_on_commit(user_id, lines):
+    """Convierte las reservas en ventas cuando la transacción del checkout se confirma"""
+    if settings.STOCK_RESERVATIONS_ENABLED and lines:
+        lines = dict(lines)
+        transaction.on_commit(lambda: _consume_now(user_id, lines))
+
+
+def sync_stock(stocks):
+    """
+    Recalcula los contadores {product_id: stock en BD} como stock menos las
+    reservas activas. Devuelve cuántas reservas vencidas se liberaron.
+    """
+    if not stocks:
+        return 0
+    return int(_sync(keys=_keys(stocks), args=[time.time(), *stocks.values()]))
+
+
+def sync_stock_on_commit(product_id, stock):
+    if not settings.STOCK_RESERVATIONS_ENABLED:
+        return
+
+    def _sync_now():
+        try:
+            sync_stock({product_id: stock})
+        except redis.RedisError:
+            pass
+
+    transaction.on_commit(_sync_now)
+
+
+def forget_product_on_commit(product_id):
+    """Borra los contadores y reservas de un producto eliminado"""
+    def _forget_now():
+        try:
+            redis_client.delete(*product_keys(product_id))
+        except redis.RedisError:
+            pass
+
+    transaction.on_commit(_forget_now)
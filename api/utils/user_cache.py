@@ -0,0 +1,200 @@
+"""
+Cache de usuarios y perfiles para la autenticación JWT.
+
+- Usuario: cache local del proceso (USER_CACHE_LOCAL_TTL, unos segundos) sobre
+  Redis (``usercache:user:{id}``, USER_CACHE_TTL). Así una ráfaga de requests
+  del mismo usuario no llega ni a Redis.
+- Perfil: solo en Redis (``usercache:profile:{user_id}``). El crédito cambia
+  con cada compra y debe verse igual desde todos los workers, así que no se
+  guarda en memoria del proceso.
+
+Las instancias se construyen con Model.from_db() y solo los campos cacheados,
+de modo que el resto queda diferido: leer ``user.password`` lo carga desde la
+base de datos y ``save()`` solo escribe los campos cargados.
+
+Las señales de User y UserProfile y el checkout (que descuenta el crédito
+con UPDATE) invalidan las entradas. Cada invalidación incrementa además una
+generación (``...:gen``); un request que leyó la base de datos antes de la
+invalidación solo guarda su copia si la generación no cambió, así que nunca
+vuelve a cachear un crédito o un usuario viejo.
+"""
+import json
+import threading
+import time
+from decimal import Decimal
+
+import redis
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from api.models import UserProfile
+from api.utils.redis_client import async_redis_client, redis_client
+
+# En el orden de los campos del modelo, como espera Model.from_db()
+USER_FIELDS = ('id', 'is_superuser', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_active')
+PROFILE_FIELDS = ('id', 'user_id', 'credit')
+
+# Límite de entradas del cache local; al superarlo se vacía completo
+LOCAL_MAX_ENTRIES = 10000
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def user_key(user_id):
+    return f"usercache:user:{user_id}"
+
+
+def profile_key(user_id):
+    return f"usercache:profile:{user_id}"
+
+
+def generation_key(key):
+    return f"{key}:gen"
+
+
+# KEYS: entrada y su generación; ARGV: generación leída antes de consultar
+# la base de datos ('' si no había), valor y TTL
+_LUA_SET_IF_CURRENT = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+"""
+
+_set_if_current = redis_client.register_script(_LUA_SET_IF_CURRENT)
+_aset_if_current = async_redis_client.register_script(_LUA_SET_IF_CURRENT)
+
+
+def _parse_read(values):
+    raw, generation = values
+    return raw, generation or ''
+
+
+def _read(key):
+    """Devuelve (valor cacheado, generación); generación None si Redis no responde"""
+    try:
+        return _parse_read(redis_client.mget(key, generation_key(key)))
+    except redis.RedisError:
+        return None, None
+
+
+async def _aread(key):
+    try:
+        return _parse_read(await async_redis_client.mget(key, generation_key(key)))
+    except redis.RedisError:
+        return None, None
+
+
+def _store(key, generation, value):
+    """Guarda la entrada solo si nadie la invalidó desde que se leyó la generación"""
+    if generation is None:
+        return
+    try:
+        _set_if_current(keys=[key, generation_key(key)], args=[generation, value, settings.USER_CACHE_TTL])
+    except redis.RedisError:
+        pass
+
+
+async def _astore(key, generation, value):
+    if generation is None:
+        return
+    try:
+        await _aset_if_current(keys=[key, generation_key(key)], args=[generation, value, settings.USER_CACHE_TTL])
+    except redis.RedisError:
+        pass
+
+
+def _invalidate(key):
+    # La generación vive más que cualquier request que la haya leído
+    try:
+        pipe = redis_client.pipeline()
+        pipe.incr(generation_key(key))
+        pipe.expire(generation_key(key), settings.USER_CACHE_TTL)
+        pipe.delete(key)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def _local_get(user_id):
+    entry = _local.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def _local_set(user_id, values):
+    with _local_lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            _local.clear()
+        _local[user_id] = (time.monotonic() + settings.USER_CACHE_LOCAL_TTL, values)
+
+
+def _user_from_values(values):
+    return User.from_db('default', USER_FIELDS, values)
+
+
+def _user_values(user):
+    return [getattr(user, field) for field in USER_FIELDS]
+
+
+def get_user(user_id):
+    """Devuelve el User con ese id (o lanza User.DoesNotExist)"""
+    values = _local_get(user_id)
+    if values is None:
+        raw, generation = _read(user_key(user_id))
+        if raw is None:
+            values = _user_values(User.objects.only(*USER_FIELDS).get(pk=user_id))
+            _store(user_key(user_id), generation, json.dumps(values))
+        else:
+            values = json.loads(raw)
+        _local_set(user_id, values)
+    return _user_from_values(values)
+
+
+async def aget_user(user_id):
+    values = _local_get(user_id)
+    if values is None:
+        raw, generation = await _aread(user_key(user_id))
+        if raw is None:
+            values = _user_values(await User.objects.only(*USER_FIELDS).aget(pk=user_id))
+            await _astore(user_key(user_id), generation, json.dumps(values))
+        else:
+            values = json.loads(raw)
+        _local_set(user_id, values)
+    return _user_from_values(values)
+
+
+def get_or_create_profile(user):
+    """Equivalente cacheado de UserProfile.objects.get_or_create(user=user, ...)"""
+    raw, generation = _read(profile_key(user.pk))
+    if raw is not None:
+        profile_id, credit = json.loads(raw)
+        return UserProfile.from_db('default', PROFILE_FIELDS, [profile_id, user.pk, Decimal(credit)]), False
+
+    profile, created = UserProfile.objects.get_or_create(
+        user=user,
+        defaults={'credit': Decimal('1000.00')}
+    )
+    _store(profile_key(user.pk), generation, json.dumps([profile.pk, str(profile.credit)]))
+    return profile, created
+
+
+def invalidate_user(user_id):
+    with _local_lock:
+        _local.pop(user_id, None)
+    _invalidate(user_key(user_id))
+
+
+def invalidate_profile(user_id):
+    _invalidate(profile_key(user_id))
+
+
+def invalidate_user_on_commit(user_id):
+    # Tras el commit, para que ningún request vuelva a cachear la fila vieja
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+def invalidate_profile_on_commit(user_id):
+    transaction.on_commit(lambda: invalidate_profile(user_id))
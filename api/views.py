@@ -1,19 +1,31 @@
-from django.shortcuts import render
-from .models import BicycleSale, Bicycle, Product, UserProfile
-from .serializers import ProductWithDetailsSerializer
+from .models import Product
+from .serializers import PRODUCT_ROW_VALUES, ProductRowSerializer, ProductWithDetailsSerializer
+from .utils.checkout import CheckoutError, merge_items, process_checkout
+from .utils import cart_store, leaderboard, metrics, pricing, stock_reservations, user_cache
+from .utils.catalog_cache import CatalogCacheMixin
+from .utils.idempotency import idempotent
+from .pagination import ProductCursorPagination
+from .utils.redis_client import pool_stats, redis_binary_pool, redis_pool
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Sum
-from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
-from decimal import Decimal
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.db.models import QuerySet
+from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
+from django.db import connection
+from decimal import Decimal, InvalidOperation
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 
+import hmac
+import logging
+
 import redis
-from django.http import JsonResponse
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
 
 # Health check endpoint
 class HealthCheckView(APIView):
@@ -27,48 +39,167 @@ class HealthCheckView(APIView):
             'version': '1.0.0'
         }, status=status.HTTP_200_OK)
 
+class PoolStatsView(APIView):
+    """
+    Estado de las conexiones a PostgreSQL y de los pools de Redis de este worker
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        db_settings = connection.settings_dict
+        database = {
+            "vendor": connection.vendor,
+            "conn_max_age": db_settings.get('CONN_MAX_AGE'),
+            "conn_health_checks": db_settings.get('CONN_HEALTH_CHECKS'),
+            "connected": connection.connection is not None,
+        }
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()"
+                )
+                database["server_connections"] = cursor.fetchone()[0]
+
+        return Response({
+            "database": database,
+            "redis": {
+                "text": pool_stats(redis_pool),
+                "binary": pool_stats(redis_binary_pool),
+            },
+        }, status=status.HTTP_200_OK)
+
+class HasMetricsToken(BasePermission):
+    """Header X-Metrics-Token igual a METRICS_TOKEN (para el scraper de Prometheus)"""
+    def has_permission(self, request, view):
+        token = request.headers.get('X-Metrics-Token', '')
+        return bool(settings.METRICS_TOKEN and token) and hmac.compare_digest(
+            token.encode(), settings.METRICS_TOKEN.encode()
+        )
+
+class MetricsView(APIView):
+    """
+    Métricas por ruta de este worker en formato de texto de Prometheus, más
+    los carritos vivos en Redis (compartidos por todos los workers).
+    Solo para administradores o con el token de métricas.
+    """
+    permission_classes = [IsAdminUser | HasMetricsToken]
+
+    def get(self, request):
+        try:
+            live_carts, cart_memory = cart_store.cart_stats()
+        except redis.RedisError:
+            live_carts, cart_memory = None, None
+        gauges = metrics.render_gauges({
+            'api_carts_live': ('Carritos con actividad dentro de CART_TTL', live_carts),
+            'api_carts_memory_bytes': ('Memoria estimada de los carritos en Redis (muestreo)', cart_memory),
+        })
+        return HttpResponse(
+            metrics.render_prometheus() + gauges,
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
 # Create your views here.
-class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.all()
+class FastProductListMixin:
+    """
+    Con FAST_JSON_ENABLED, los listados de productos se arman con values() y
+    ProductRowSerializer en lugar de instancias y ModelSerializer. La salida
+    es la misma byte a byte (benchmark_serializers lo verifica).
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_JSON_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.values(*PRODUCT_ROW_VALUES)
+            serialize = lambda rows: ProductRowSerializer(rows, context=self.get_serializer_context()).data
+        else:
+            # Listas ya armadas (ranking de ventas): el serializer de siempre
+            serialize = lambda products: self.get_serializer(products, many=True).data
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(queryset))
+
+class ProductListAPIView(FastProductListMixin, CatalogCacheMixin, generics.ListAPIView):
+    """
+    Listado paginado por cursor. Filtros opcionales: ?type=, ?category=,
+    ?min_price=, ?max_price=; campos con ?fields=id,name,...
+    """
+    cache_name = 'products'
     serializer_class = ProductWithDetailsSerializer
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        queryset = Product.objects.with_details()
+        params = self.request.query_params
+
+        product_type = params.get('type')
+        if product_type:
+            if product_type not in dict(Product.PRODUCT_TYPES):
+                raise ValidationError({"type": f"Tipo de producto inválido: {product_type}"})
+            queryset = queryset.filter(type=product_type)
 
-class TopDiscountedGearAPIView(generics.ListAPIView): #just send 3 products with discount
+        category = params.get('category')
+        if category:
+            if not category.isdigit():
+                raise ValidationError({"category": "category debe ser un ID numérico"})
+            queryset = queryset.filter(category_id=int(category))
+
+        for param, lookup in (('min_price', 'price__gte'), ('max_price', 'price__lte')):
+            value = params.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{lookup: Decimal(value)})
+                except InvalidOperation:
+                    raise ValidationError({param: f"Precio inválido: {value}"})
+
+        return queryset
+
+class TopDiscountedGearAPIView(FastProductListMixin, CatalogCacheMixin, generics.ListAPIView): #just send 3 products with discount
+    cache_name = 'gear-discounts'
     serializer_class = ProductWithDetailsSerializer
 
     def get_queryset(self):
-        return Product.objects.filter(discount__gt=0).order_by('-discount')[:3]
+        return Product.objects.with_details().filter(discount__gt=0).order_by('-discount')[:3]
 
-class TopSellingBicyclesAPIView(APIView):
-    def get(self, request):
-        # Agrupa por bicicleta y suma las cantidades vendidas
-        top_bicycles = (
-            BicycleSale.objects
-            .values('bicycle')  # agrupar por ID de bicicleta
-            .annotate(total_sold=Sum('quantity'))  # sumar las ventas
-            .order_by('-total_sold')[:3]  # top 3
-        )
+class TopSellingBicyclesAPIView(FastProductListMixin, CatalogCacheMixin, generics.ListAPIView):
+    """
+    Top 3 de bicicletas más vendidas. ?window=7 o ?window=30 limita el
+    ranking a los últimos días.
+    """
+    # Las ventas cambian en cada checkout, igual que el stock
+    cache_name = 'top-bicycles'
+    serializer_class = ProductWithDetailsSerializer
 
-        # Obtener los objetos reales de Bicycle a partir de los IDs
-        top_bicycle_ids = [item['bicycle'] for item in top_bicycles]
-        top_bicycles_instances = Bicycle.objects.filter(product_id__in=top_bicycle_ids)
+    def get_queryset(self):
+        window = self.request.query_params.get('window')
+        if window is not None:
+            if not window.isdigit() or int(window) not in leaderboard.WINDOWS:
+                raise ValidationError({"window": f"Ventana inválida, usa una de: {leaderboard.WINDOWS}"})
+            window = int(window)
 
-        # Serializar productos relacionados
-        serializer = ProductWithDetailsSerializer(
-            [b.product for b in top_bicycles_instances], many=True
-        )
+        # Ranking mantenido en Redis (la PK de Bicycle es el ID del producto)
+        top_bicycle_ids = leaderboard.top_bicycle_ids(limit=3, window=window)
+        products = Product.objects.with_details().in_bulk(top_bicycle_ids)
+
+        # Conservar el orden del ranking
+        return [products[pk] for pk in top_bicycle_ids if pk in products]
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    
 
 class BuyCheckoutView(APIView):
     permission_classes = [IsAuthenticated]
 
+    # Con header Idempotency-Key, los reintentos reciben la respuesta original
+    @idempotent
     def post(self, request):
         user = request.user
         total = request.data.get('total')
         items = request.data.get('items', [])
         
-        print(f"DEBUG: Datos recibidos - Total: {total}, Items: {items}")
+        logger.debug("Checkout recibido - usuario=%s total=%s items=%s", user.pk, total, items)
         
         if not items:
             return Response(
@@ -76,28 +207,46 @@ class BuyCheckoutView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if not total:
+        # El total lo calcula el servidor; si el cliente envía el que mostró,
+        # se usa solo para confirmar que los precios no cambiaron
+        expected_total = None
+        if total not in (None, ''):
+            try:
+                expected_total = Decimal(str(total))
+            except (ValueError, TypeError, InvalidOperation):
+                return Response(
+                    {"error": "Total de compra inválido"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        try:
+            lines = merge_items(items)
+        except CheckoutError as e:
+            return Response({"error": e.message}, status=e.status_code)
+
+        prices = pricing.load_prices(lines)
+        missing = [product_id for product_id in lines if product_id not in prices]
+        if missing:
             return Response(
-                {"error": "Total de compra es requerido"}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {"error": f"Producto con ID {missing[0]} no encontrado"},
+                status=status.HTTP_404_NOT_FOUND
             )
-        
-        try:
-            total_amount = Decimal(str(total))
-        except (ValueError, TypeError):
+        _, total_amount = pricing.cart_total(lines, prices)
+
+        if expected_total is not None and expected_total != total_amount:
             return Response(
-                {"error": "Total de compra inválido"}, 
-                status=status.HTTP_400_BAD_REQUEST
+                {
+                    "error": "El total no coincide con los precios actuales",
+                    "total_amount": str(total_amount)
+                },
+                status=status.HTTP_409_CONFLICT
             )
         
         # Obtener o crear el perfil del usuario
-        user_profile, created = UserProfile.objects.get_or_create(
-            user=user,
-            defaults={'credit': Decimal('1000.00')}
-        )
+        user_profile, created = user_cache.get_or_create_profile(user)
         
         if created:
-            print(f"DEBUG: Perfil creado para usuario {user.username} con crédito inicial de $1000.00")
+            logger.info("Perfil creado para usuario %s con crédito inicial de $1000.00", user.pk)
         
         # Verificar que el usuario tenga suficiente crédito
         if user_profile.credit < total_amount:
@@ -107,113 +256,38 @@ class BuyCheckoutView(APIView):
             )
         
         try:
-            with transaction.atomic():
-                created_sales = []
-                
-                for item in items:
-                    product_id = item.get('product_id')
-                    quantity = item.get('quantity')
-                    
-                    print(f"DEBUG: Procesando item - Product ID: {product_id}, Quantity: {quantity}")
-                    
-                    if not product_id or not quantity:
-                        continue
-                    
-                    try:
-                        # Buscar el producto
-                        product = Product.objects.get(id=product_id)
-                        
-                        print(f"DEBUG: Producto encontrado - ID: {product.id}, Nombre: {product.name}, Tipo: {product.type}, Stock: {product.stock}")
-                        
-                        # Verificar stock disponible
-                        if product.stock < quantity:
-                            print(f"DEBUG: ERROR - Stock insuficiente para {product.name}. Disponible: {product.stock}, Solicitado: {quantity}")
-                            return Response(
-                                {"error": f"Stock insuficiente para {product.name}. Disponible: {product.stock}, Solicitado: {quantity}"}, 
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
-                        
-                        # Manejar diferentes tipos de productos
-                        if product.type == 'bicycle':
-                            # Para bicicletas, crear registro en BicycleSale
-                            try:
-                                bicycle = product.bicycle
-                                print(f"DEBUG: Bicicleta asociada encontrada")
-                                
-                                sale = BicycleSale.objects.create(
-                                    bicycle=bicycle,
-                                    user=user,
-                                    quantity=quantity
-                                )
-                                created_sales.append(sale)
-                                print(f"DEBUG: Venta de bicicleta creada - Sale ID: {sale.id}, Producto: {product.name}")
-                                
-                            except Bicycle.DoesNotExist:
-                                print(f"DEBUG: ERROR - No se encontró bicicleta asociada al producto {product.name}")
-                                return Response(
-                                    {"error": f"Bicicleta asociada al producto {product_id} no encontrada"}, 
-                                    status=status.HTTP_404_NOT_FOUND
-                                )
-                        
-                        elif product.type == 'accessory':
-                            # Para accesorios, solo registramos la compra (podrías crear un modelo AccessorySale si quieres)
-                            print(f"DEBUG: Procesando accesorio - {product.name}")
-                            # Por ahora solo reducimos el stock, pero podrías crear un modelo separado para accesorios
-                        
-                        else:
-                            print(f"DEBUG: ERROR - Tipo de producto no soportado: {product.type}")
-                            return Response(
-                                {"error": f"Tipo de producto no soportado: {product.type}"}, 
-                                status=status.HTTP_400_BAD_REQUEST
-                            )
-                        
-                        # Reducir el stock para todos los tipos de productos
-                        product.stock -= quantity
-                        product.save()
-                        
-                        print(f"DEBUG: Stock actualizado para {product.name} - Nuevo stock: {product.stock}")
-                        
-                    except Product.DoesNotExist:
-                        print(f"DEBUG: ERROR - Producto con ID {product_id} no encontrado en la base de datos")
-                        return Response(
-                            {"error": f"Producto con ID {product_id} no encontrado"}, 
-                            status=status.HTTP_404_NOT_FOUND
-                        )
-                    except Exception as item_error:
-                        print(f"DEBUG: ERROR - Error procesando producto {product_id}: {str(item_error)}")
-                        return Response(
-                            {"error": f"Error procesando producto {product_id}: {str(item_error)}"}, 
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
-                
-                # Reducir el crédito del usuario
-                user_profile.credit -= total_amount
-                user_profile.save()
-                
-                print(f"DEBUG: Crédito actualizado - Nuevo crédito: ${user_profile.credit}")
-                
-                # Limpiar el carrito (opcional)
-                from api.utils.redis_client import redis_client
-                import json
-                cart_key = f"cart:{user.id}"
-                redis_client.delete(cart_key)
-                
-                print(f"DEBUG: Carrito limpiado para usuario {user.username}")
-                
-                return Response({
-                    "message": "Compra realizada con éxito",
-                    "bicycle_sales_created": len(created_sales),
-                    "total_amount": str(total_amount),
-                    "remaining_credit": str(user_profile.credit)
-                }, status=status.HTTP_200_OK)
-                
+            result = process_checkout(user, items, expected_total=total_amount)
+        except CheckoutError as e:
+            logger.info("Checkout rechazado para usuario %s: %s", user.pk, e.message)
+            return Response({"error": e.message}, status=e.status_code)
         except Exception as e:
-            print(f"DEBUG: Error en transacción: {str(e)}")
+            logger.exception("Error en la transacción de checkout del usuario %s", user.pk)
             return Response(
                 {"error": f"Error procesando la compra: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        # Limpiar el carrito (opcional) y liberar las reservas de lo que no se compró.
+        # La compra ya está confirmada: si Redis falla aquí se responde igual
+        # (las reservas vencen solas) para que @idempotent guarde la respuesta
+        try:
+            stock_reservations.release(user.id, cart_store.get_cart(user.id).keys())
+            cart_store.clear_cart(user.id)
+        except redis.RedisError:
+            logger.warning("No se pudo vaciar el carrito del usuario %s tras el checkout", user.pk)
+
+        logger.debug(
+            "Checkout completado - usuario=%s ventas=%s crédito restante=%s",
+            user.pk, result["bicycle_sales_created"], result["remaining_credit"]
+        )
+
+        return Response({
+            "message": "Compra realizada con éxito",
+            "bicycle_sales_created": result["bicycle_sales_created"],
+            "total_amount": str(result["total_amount"]),
+            "remaining_credit": str(result["remaining_credit"])
+        }, status=status.HTTP_200_OK)
+
 class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -229,10 +303,7 @@ class UserCreditView(APIView):
         user = request.user
         
         # Obtener o crear el perfil del usuario
-        user_profile, created = UserProfile.objects.get_or_create(
-            user=user,
-            defaults={'credit': Decimal('1000.00')}
-        )
+        user_profile, created = user_cache.get_or_create_profile(user)
         
         return Response({
             "username": user.username,
@@ -247,18 +318,23 @@ class DebugCheckoutView(APIView):
         """Vista de debug para ver qué datos está enviando el frontend"""
         user = request.user
         
-        print(f"=== DEBUG CHECKOUT ===")
-        print(f"Usuario: {user.username}")
-        print(f"Headers: {dict(request.headers)}")
-        print(f"Datos recibidos: {request.data}")
-        print(f"Método: {request.method}")
-        print(f"Content-Type: {request.content_type}")
+        headers = dict(request.headers)
+        if logger.isEnabledFor(logging.DEBUG):
+            # El token no debe terminar en los logs
+            logged_headers = {
+                name: ('***' if name.lower() in ('authorization', 'cookie') else value)
+                for name, value in headers.items()
+            }
+            logger.debug(
+                "Debug checkout - usuario=%s método=%s content_type=%s headers=%s datos=%s",
+                user.username, request.method, request.content_type, logged_headers, request.data
+            )
         
         return Response({
             "debug_info": {
                 "user": user.username,
                 "received_data": request.data,
-                "headers": dict(request.headers),
+                "headers": headers,
                 "method": request.method,
                 "content_type": request.content_type
             }
@@ -0,0 +1,54 @@
+#!/bin/bash
+
+# Compara conexiones a PostgreSQL por request (DB_CONN_MAX_AGE=0) con
+# conexiones persistentes (DB_CONN_MAX_AGE=60) bajo la prueba de carga.
+#
+# Levanta gunicorn (workers síncronos) con cada configuración, corre
+# load_test contra él y lo detiene; las configuraciones se alternan RUNS
+# veces. Usa la base y el Redis del entorno actual, que deben tener el
+# catálogo de generate_catalog (con al menos USERS usuarios):
+#
+#   python manage.py generate_catalog --products 10000 --sales 50000 --users 40
+#   ./benchmarks/connections.sh
+#
+# La salida se agrega a OUTPUT (default: benchmarks/connections-results.txt).
+set -e
+
+cd "$(dirname "$0")/.."
+
+RUNS=${RUNS:-2}
+PORT=${PORT:-8001}
+GUNICORN_WORKERS=${GUNICORN_WORKERS:-3}
+USERS=${USERS:-20}
+ITERATIONS=${ITERATIONS:-20}
+OUTPUT=${OUTPUT:-benchmarks/connections-results.txt}
+
+run_once() {
+  local conn_max_age=$1
+  DB_CONN_MAX_AGE=$conn_max_age gunicorn royalbike.wsgi:application \
+      --bind 127.0.0.1:$PORT \
+      --workers $GUNICORN_WORKERS \
+      --log-level warning &
+  local pid=$!
+
+  # Esperar a que el servidor responda
+  for _ in $(seq 1 30); do
+    curl -sf "http://127.0.0.1:$PORT/api/health/" > /dev/null && break
+    sleep 1
+  done
+
+  echo "--- DB_CONN_MAX_AGE=$conn_max_age"
+  python manage.py load_test --base-url "http://127.0.0.1:$PORT" --users $USERS --iterations $ITERATIONS || true
+
+  kill $pid
+  wait $pid 2>/dev/null || true
+}
+
+{
+  echo "=== $(date -u '+%Y-%m-%d %H:%M UTC') · $(nproc) CPU · $GUNICORN_WORKERS workers · $USERS usuarios x $ITERATIONS recorridos"
+  for run in $(seq 1 $RUNS); do
+    for conn_max_age in 0 60; do
+      run_once $conn_max_age
+    done
+  done
+} 2>&1 | tee -a "$OUTPUT"
@@ -76,7 +76,7 @@ main() {
                 source venv/bin/activate
                 pip install -r requirements.txt
             }
-            python manage.py migrate
+            python manage.py migrate --fake-initial
             python manage.py runserver 0.0.0.0:8000
             ;;
         "build")
@@ -106,7 +106,7 @@ main() {
             check_python
             source venv/bin/activate 2>/dev/null || echo "Activando entorno virtual..."
             python manage.py makemigrations
-            python manage.py migrate
+            python manage.py migrate --fake-initial
             ;;
         "shell")
             echo -e "${GREEN}🐚 Abriendo Django shell...${NC}"
@@ -44,8 +44,11 @@ else
 fi
 
 # Ejecutar migraciones
+# --fake-initial: las bases creadas antes de que el repositorio incluyera
+# api/migrations/ ya tienen las tablas api_*; la migración inicial se marca
+# como aplicada en lugar de fallar con "relation already exists"
 echo "Ejecutando migraciones..."
-python manage.py migrate --settings=royalbike.settings_prod
+python manage.py migrate --fake-initial --settings=royalbike.settings_prod
 
 # Crear superusuario si no existe
 echo "Verificando superusuario..."
@@ -69,10 +72,30 @@ echo "Recopilando archivos estáticos..."
 python manage.py collectstatic --noinput --settings=royalbike.settings_prod
 
 # Iniciar el servidor con Gunicorn
+# SERVER_MODE=wsgi (por defecto): workers síncronos
+# SERVER_MODE=asgi: workers uvicorn, habilita las vistas asíncronas /api/async/...
+SERVER_MODE=${SERVER_MODE:-wsgi}
+GUNICORN_WORKERS=${GUNICORN_WORKERS:-3}
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+  echo "Iniciando servidor Gunicorn con workers Uvicorn (ASGI)..."
+  exec gunicorn royalbike.asgi:application \
+      --worker-class uvicorn_worker.UvicornWorker \
+      --bind 0.0.0.0:8000 \
+      --workers $GUNICORN_WORKERS \
+      --timeout 30 \
+      --keep-alive 2 \
+      --max-requests 1000 \
+      --max-requests-jitter 100 \
+      --log-level info \
+      --access-logfile - \
+      --error-logfile -
+fi
+
 echo "Iniciando servidor Gunicorn..."
 exec gunicorn royalbike.wsgi:application \
     --bind 0.0.0.0:8000 \
-    --workers 3 \
+    --workers $GUNICORN_WORKERS \
     --timeout 30 \
     --keep-alive 2 \
     --max-requests 1000 \
@@ -12,8 +12,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from datetime import timedelta
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -32,6 +35,62 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS').split(',') if os.environ.get('AL
 REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.environ.get('REDIS_PORT', '6379'))
 REDIS_DB = int(os.environ.get('REDIS_DB', '0'))
+# manage.py test usa una base de Redis aparte, que los tests vacían
+TESTING = sys.argv[1:2] == ['test']
+REDIS_TEST_DB = int(os.environ.get('REDIS_TEST_DB', '15'))
+if TESTING:
+    REDIS_DB = REDIS_TEST_DB
+
+# Pool de conexiones a Redis (compartido por todos los hilos del worker)
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '50'))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', '5'))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '5'))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', '2'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+
+# Cache de respuestas del catálogo (segundos)
+CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', 'True') == 'True'
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', '3600'))
+# max-age del catálogo para navegadores y CDN; luego revalidan con ETag
+CATALOG_HTTP_MAX_AGE = int(os.environ.get('CATALOG_HTTP_MAX_AGE', '60'))
+
+# Reservas de stock en Redis al agregar productos al carrito (segundos)
+STOCK_RESERVATIONS_ENABLED = os.environ.get('STOCK_RESERVATIONS_ENABLED', 'True') == 'True'
+CART_RESERVATION_TTL = int(os.environ.get('CART_RESERVATION_TTL', '900'))
+
+# Expiración deslizante de los carritos (segundos, 0 = sin expiración) y
+# archivado en AbandonedCart por sweep_abandoned_carts antes de expirar
+CART_TTL = int(os.environ.get('CART_TTL', '604800'))
+CART_ARCHIVE_ENABLED = os.environ.get('CART_ARCHIVE_ENABLED', 'False') == 'True'
+
+# Antigüedad máxima (segundos) de las instantáneas de producto del carrito
+PRODUCT_SNAPSHOT_MAX_AGE = int(os.environ.get('PRODUCT_SNAPSHOT_MAX_AGE', '300'))
+
+# Idempotency-Key del checkout (segundos): respuestas guardadas, candado de
+# la petición en curso y espera máxima de los duplicados concurrentes
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', '86400'))
+IDEMPOTENCY_LOCK_TTL = int(os.environ.get('IDEMPOTENCY_LOCK_TTL', '30'))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', '10'))
+
+# Cache de usuarios y perfiles para la autenticación JWT (segundos)
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))
+USER_CACHE_LOCAL_TTL = float(os.environ.get('USER_CACHE_LOCAL_TTL', '5'))
+
+# Línea de log JSON por request (logger api.metrics)
+METRICS_LOG_REQUESTS = os.environ.get('METRICS_LOG_REQUESTS', 'True') == 'True'
+# Token compartido para leer /api/metrics/ sin ser admin (header X-Metrics-Token);
+# vacío desactiva el acceso por token
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Logging del app api: nivel, fracción de mensajes DEBUG que se emiten y
+# logging de depuración dentro del bucle del checkout
+API_LOG_LEVEL = os.environ.get('API_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1.0'))
+CHECKOUT_DEBUG_LOGGING = os.environ.get('CHECKOUT_DEBUG_LOGGING', str(DEBUG)) == 'True'
+
+# Paginación del listado de productos
+PRODUCTS_PAGE_SIZE = int(os.environ.get('PRODUCTS_PAGE_SIZE', '50'))
+PRODUCTS_MAX_PAGE_SIZE = int(os.environ.get('PRODUCTS_MAX_PAGE_SIZE', '200'))
 
 # Application definition
 
@@ -50,10 +109,25 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication con el usuario cacheado (api/utils/user_cache.py)
+        'api.authentication.CachedJWTAuthentication',
     )
 }
 
+# Compresión gzip/brotli de respuestas JSON (api/utils/compression.py)
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', 'True') == 'True'
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+RESPONSE_COMPRESSION_LEVEL = int(os.environ.get('RESPONSE_COMPRESSION_LEVEL', '6'))
+RESPONSE_COMPRESSION_TYPES = os.environ.get('RESPONSE_COMPRESSION_TYPES', 'application/json').split(',')
+
+# Renderer con orjson y listados de productos sobre values() (api/renderers.py)
+FAST_JSON_ENABLED = os.environ.get('FAST_JSON_ENABLED', 'False') == 'True'
+if FAST_JSON_ENABLED:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+
 SIMPLE_JWT = {
     'SIGNING_KEY': os.environ.get('JWT_SECRET_KEY'),
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -67,6 +141,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',  # Debe ir primero para medir el request completo
+    'api.middleware.CompressionMiddleware',  # Antes que el resto: las métricas ven el tamaño comprimido
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +155,7 @@ MIDDLEWARE = [
 
 CORS_ALLOW_ALL_ORIGINS = os.environ.get('CORS_ALLOW_ALL_ORIGINS', 'False') == 'True'
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS').split(',') if os.environ.get('CORS_ALLOWED_ORIGINS') else []
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-request-id')
 
 ROOT_URLCONF = 'royalbike.urls'
 
@@ -111,9 +188,18 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # Conexiones persistentes: se reutilizan entre requests del mismo worker
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Bajo ASGI cada request corre en su propio hilo y las conexiones
+# persistentes (por hilo) se acumulan hasta agotar max_connections de
+# PostgreSQL: en ese modo se usan conexiones por request
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -156,6 +242,50 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'api.utils.log_context.RequestIdFilter',
+        },
+        'sampled_debug': {
+            '()': 'api.utils.log_context.SampledDebugFilter',
+            'rate': LOG_DEBUG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'request': {
+            'format': '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
+        'api_console': {
+            'level': 'DEBUG',
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id', 'sampled_debug'],
+            'formatter': 'request',
+        },
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'api': {
+            'handlers': ['api_console'],
+            'level': API_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = os.environ.get('SECURE_SSL_REDIRECT', 'False') == 'True'
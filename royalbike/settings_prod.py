@@ -2,6 +2,7 @@
 Configuración de producción para Django
 """
 import os
+import sys
 import environ
 from pathlib import Path
 
@@ -25,6 +26,62 @@ ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost', '127.0.0.1', '0.
 REDIS_HOST = env('REDIS_HOST', default='localhost')
 REDIS_PORT = env.int('REDIS_PORT', default=6379)
 REDIS_DB = env.int('REDIS_DB', default=0)
+# manage.py test usa una base de Redis aparte, que los tests vacían
+TESTING = sys.argv[1:2] == ['test']
+REDIS_TEST_DB = env.int('REDIS_TEST_DB', default=15)
+if TESTING:
+    REDIS_DB = REDIS_TEST_DB
+
+# Pool de conexiones a Redis (compartido por todos los hilos del worker)
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=50)
+REDIS_POOL_TIMEOUT = env.float('REDIS_POOL_TIMEOUT', default=5)
+REDIS_SOCKET_TIMEOUT = env.float('REDIS_SOCKET_TIMEOUT', default=5)
+REDIS_SOCKET_CONNECT_TIMEOUT = env.float('REDIS_SOCKET_CONNECT_TIMEOUT', default=2)
+REDIS_HEALTH_CHECK_INTERVAL = env.int('REDIS_HEALTH_CHECK_INTERVAL', default=30)
+
+# Cache de respuestas del catálogo (segundos)
+CATALOG_CACHE_ENABLED = env.bool('CATALOG_CACHE_ENABLED', default=True)
+CATALOG_CACHE_TTL = env.int('CATALOG_CACHE_TTL', default=3600)
+# max-age del catálogo para navegadores y CDN; luego revalidan con ETag
+CATALOG_HTTP_MAX_AGE = env.int('CATALOG_HTTP_MAX_AGE', default=60)
+
+# Reservas de stock en Redis al agregar productos al carrito (segundos)
+STOCK_RESERVATIONS_ENABLED = env.bool('STOCK_RESERVATIONS_ENABLED', default=True)
+CART_RESERVATION_TTL = env.int('CART_RESERVATION_TTL', default=900)
+
+# Expiración deslizante de los carritos (segundos, 0 = sin expiración) y
+# archivado en AbandonedCart por sweep_abandoned_carts antes de expirar
+CART_TTL = env.int('CART_TTL', default=604800)
+CART_ARCHIVE_ENABLED = env.bool('CART_ARCHIVE_ENABLED', default=False)
+
+# Antigüedad máxima (segundos) de las instantáneas de producto del carrito
+PRODUCT_SNAPSHOT_MAX_AGE = env.int('PRODUCT_SNAPSHOT_MAX_AGE', default=300)
+
+# Idempotency-Key del checkout (segundos): respuestas guardadas, candado de
+# la petición en curso y espera máxima de los duplicados concurrentes
+IDEMPOTENCY_TTL = env.int('IDEMPOTENCY_TTL', default=86400)
+IDEMPOTENCY_LOCK_TTL = env.int('IDEMPOTENCY_LOCK_TTL', default=30)
+IDEMPOTENCY_WAIT_TIMEOUT = env.float('IDEMPOTENCY_WAIT_TIMEOUT', default=10)
+
+# Cache de usuarios y perfiles para la autenticación JWT (segundos)
+USER_CACHE_TTL = env.int('USER_CACHE_TTL', default=300)
+USER_CACHE_LOCAL_TTL = env.float('USER_CACHE_LOCAL_TTL', default=5)
+
+# Línea de log JSON por request (logger api.metrics)
+METRICS_LOG_REQUESTS = env.bool('METRICS_LOG_REQUESTS', default=True)
+# Token compartido para leer /api/metrics/ sin ser admin (header X-Metrics-Token);
+# vacío desactiva el acceso por token
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Logging del app api: nivel, fracción de mensajes DEBUG que se emiten y
+# logging de depuración dentro del bucle del checkout (desactivado en producción)
+API_LOG_LEVEL = env('API_LOG_LEVEL', default='INFO')
+LOG_DEBUG_SAMPLE_RATE = env.float('LOG_DEBUG_SAMPLE_RATE', default=1.0)
+CHECKOUT_DEBUG_LOGGING = env.bool('CHECKOUT_DEBUG_LOGGING', default=False)
+
+# Paginación del listado de productos
+PRODUCTS_PAGE_SIZE = env.int('PRODUCTS_PAGE_SIZE', default=50)
+PRODUCTS_MAX_PAGE_SIZE = env.int('PRODUCTS_MAX_PAGE_SIZE', default=200)
 
 # Application definition
 INSTALLED_APPS = [
@@ -42,10 +99,25 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication con el usuario cacheado (api/utils/user_cache.py)
+        'api.authentication.CachedJWTAuthentication',
     )
 }
 
+# Compresión gzip/brotli de respuestas JSON (api/utils/compression.py)
+RESPONSE_COMPRESSION_ENABLED = env.bool('RESPONSE_COMPRESSION_ENABLED', default=True)
+RESPONSE_COMPRESSION_MIN_SIZE = env.int('RESPONSE_COMPRESSION_MIN_SIZE', default=1024)
+RESPONSE_COMPRESSION_LEVEL = env.int('RESPONSE_COMPRESSION_LEVEL', default=6)
+RESPONSE_COMPRESSION_TYPES = env.list('RESPONSE_COMPRESSION_TYPES', default=['application/json'])
+
+# Renderer con orjson y listados de productos sobre values() (api/renderers.py)
+FAST_JSON_ENABLED = env.bool('FAST_JSON_ENABLED', default=False)
+if FAST_JSON_ENABLED:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    )
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -57,6 +129,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',  # Debe ir primero para medir el request completo
+    'api.middleware.CompressionMiddleware',  # Antes que el resto: las métricas ven el tamaño comprimido
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir archivos estáticos
     'corsheaders.middleware.CorsMiddleware',
@@ -89,6 +163,8 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
+    'x-request-id',
 ]
 
 ROOT_URLCONF = 'royalbike.urls'
@@ -127,6 +203,16 @@ else:
         }
     }
 
+# Conexiones persistentes: se reutilizan entre requests del mismo worker
+DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+
+# Bajo ASGI cada request corre en su propio hilo y las conexiones
+# persistentes (por hilo) se acumulan hasta agotar max_connections de
+# PostgreSQL: en ese modo se usan conexiones por request
+if env('SERVER_MODE', default='wsgi') == 'asgi':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -169,11 +255,31 @@ if not DEBUG:
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {
+            '()': 'api.utils.log_context.RequestIdFilter',
+        },
+        'sampled_debug': {
+            '()': 'api.utils.log_context.SampledDebugFilter',
+            'rate': LOG_DEBUG_SAMPLE_RATE,
+        },
+    },
+    'formatters': {
+        'request': {
+            'format': '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s',
+        },
+    },
     'handlers': {
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
         },
+        'api_console': {
+            'level': 'DEBUG',
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id', 'sampled_debug'],
+            'formatter': 'request',
+        },
     },
     'loggers': {
         'django': {
@@ -181,5 +287,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'api': {
+            'handlers': ['api_console'],
+            'level': API_LOG_LEVEL,
+            'propagate': False,
+        },
     },
 }